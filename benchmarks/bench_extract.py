@@ -0,0 +1,56 @@
+"""Micro-benchmark: fast __INITIAL_STATE__ extraction vs. the full BeautifulSoup parse.
+
+Usage:
+    python benchmarks/bench_extract.py saved_pages/*.html
+    python benchmarks/bench_extract.py --synthetic 20
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import webmd_extract
+from webmd_extract import extract_initial_state_bs4, extract_initial_state_fast
+from fixtures import build_review, build_review_page
+
+def time_extractor(extractor: Callable, pages: List[str], repeat: int) -> float:
+    """Return the mean seconds per page for an extractor."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            if extractor(page) is None:
+                raise ValueError(f"{extractor.__name__} found no state in a page")
+    return (time.perf_counter() - start) / (repeat * len(pages))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pages', nargs='*', help='Saved WebMD review pages (HTML)')
+    parser.add_argument('--synthetic', type=int, default=0, help='Number of generated pages to add')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.pages:
+        with open(path, encoding='utf-8') as f:
+            pages.append(f.read())
+    for i in range(args.synthetic):
+        pages.append(build_review_page([build_review(i * 20 + j) for j in range(20)]))
+    if not pages:
+        parser.error('pass saved pages or --synthetic N')
+
+    total_mb = sum(len(page) for page in pages) / 1e6
+    print(f"{len(pages)} pages, {total_mb:.1f} MB total")
+
+    bs4_time = time_extractor(extract_initial_state_bs4, pages, args.repeat)
+    fast_time = time_extractor(extract_initial_state_fast, pages, args.repeat)
+    backend = 'orjson' if webmd_extract.orjson is not None else 'json'
+
+    print(f"BeautifulSoup:        {bs4_time * 1000:8.2f} ms/page")
+    print(f"Fast path ({backend}): {fast_time * 1000:8.2f} ms/page")
+    print(f"Speedup:              {bs4_time / fast_time:8.1f}x")
+
+if __name__ == "__main__":
+    main()
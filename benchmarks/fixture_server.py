@@ -0,0 +1,154 @@
+"""Local stand-in for WebMD that serves recorded-style pages with configurable latency and errors.
+
+Requests are routed by the original host as the first path segment, e.g.
+    /www.webmd.com/vitamins/alpha/a
+    /reviews.webmd.com/vitamins-supplements/ingredientreview-12-SUPPLEMENT-12?page=2
+    /reviews.webmd.com/drugs/drugreview-7-drug-7-oral?page=1
+
+Pages saved under --pages-dir override the generated ones; name them after
+the routed path with "/" replaced by "_" (query string excluded).
+"""
+import argparse
+import os
+import random
+import re
+import string
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from fixtures import build_index_page, build_review, build_review_page
+
+PAGE_SIZE = 20
+INGREDIENT_REVIEW_RE = re.compile(r'^/reviews\.webmd\.com/vitamins-supplements/ingredientreview-(\d+)-')
+DRUG_REVIEW_RE = re.compile(r'^/reviews\.webmd\.com/drugs/drugreview-(\d+)-')
+ALPHA_RE = re.compile(r'^/www\.webmd\.com/vitamins/alpha/([a-z0])$')
+
+def review_count(item_id: int) -> int:
+    """Deterministic review count per supplement/drug id, with a spread of small and large targets."""
+    return (item_id * 37) % 180 + (item_id % 3) * 40
+
+def supplements_for_letter(letter: str, per_letter: int) -> List[dict]:
+    offset = (string.ascii_lowercase + '0').index(letter) * per_letter
+    return [
+        {'id': offset + i + 1, 'name': f'{letter.upper()} Supplement {i}', 'slug': f'{letter}-supplement-{i}'}
+        for i in range(per_letter)
+    ]
+
+class FixtureServer:
+    """Threaded HTTP server serving WebMD-shaped fixtures."""
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 supplements_per_letter: int = 4, pages_dir: Optional[str] = None, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.supplements_per_letter = supplements_per_letter
+        self.pages_dir = pages_dir
+        self.random = random.Random(seed)
+        self.page_cache: Dict[str, bytes] = {}
+        self.requests_served = 0
+        self.errors_injected = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.httpd.server_port}'
+
+    def start(self) -> 'FixtureServer':
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def render(self, path: str, query: dict) -> Optional[bytes]:
+        """Return the page body for a routed path, or None for a 404."""
+        page = int(query.get('page', ['1'])[0])
+        cache_key = f'{path}?page={page}'
+        if cache_key in self.page_cache:
+            return self.page_cache[cache_key]
+
+        recorded = os.path.join(self.pages_dir, path.strip('/').replace('/', '_')) if self.pages_dir else None
+        if recorded and os.path.exists(recorded):
+            with open(recorded, 'rb') as f:
+                body = f.read()
+        elif ALPHA_RE.match(path):
+            letter = ALPHA_RE.match(path).group(1)
+            body = build_index_page(supplements_for_letter(letter, self.supplements_per_letter)).encode('utf-8')
+        elif INGREDIENT_REVIEW_RE.match(path) or DRUG_REVIEW_RE.match(path):
+            is_supplement = bool(INGREDIENT_REVIEW_RE.match(path))
+            item_id = int((INGREDIENT_REVIEW_RE.match(path) or DRUG_REVIEW_RE.match(path)).group(1))
+            total = review_count(item_id)
+            first = (page - 1) * PAGE_SIZE
+            reviews = [build_review(item_id * 1000 + i) for i in range(first, min(first + PAGE_SIZE, total))]
+            body = build_review_page(reviews, is_supplement=is_supplement, total_reviews=total,
+                                     rating=1 + (item_id % 40) / 10).encode('utf-8')
+        else:
+            return None
+
+        with self.lock:
+            self.page_cache[cache_key] = body
+        return body
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with server.lock:
+                    server.requests_served += 1
+                    delay = max(server.latency_ms + server.random.uniform(-server.jitter_ms, server.jitter_ms), 0)
+                    fail = server.random.random() < server.error_rate
+                    if fail:
+                        server.errors_injected += 1
+                time.sleep(delay / 1000)
+
+                if fail:
+                    self._send(503, b'Service Unavailable', {'Retry-After': '0'})
+                    return
+                parts = urlsplit(self.path)
+                body = server.render(parts.path, parse_qs(parts.query))
+                if body is None:
+                    self._send(404, b'Not Found')
+                else:
+                    self._send(200, body, {'Content-Type': 'text/html; charset=utf-8'})
+
+            def _send(self, status: int, body: bytes, headers: Optional[dict] = None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=10.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--pages-dir')
+    args = parser.parse_args()
+
+    server = FixtureServer(args.latency_ms, args.jitter_ms, args.error_rate, pages_dir=args.pages_dir).start()
+    print(f"Serving WebMD fixtures at {server.url} (Ctrl+C to stop)")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
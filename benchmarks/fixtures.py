@@ -0,0 +1,56 @@
+import json
+from typing import List
+
+def build_review(index: int) -> dict:
+    """Build a single review record shaped like WebMD's review_nimvs entries."""
+    return {
+        'DisplayName': f'Reviewer {index}',
+        'AgeRange': '45-54',
+        'TimeRange': '1 to 6 months',
+        'SecondaryName_s': 'Kidney Stones',
+        'DatePosted': f'{index % 12 + 1}/{index % 28 + 1}/2023 {index % 12 + 1}:15:30 PM',
+        'OverAll_UserReviewRating': index % 5 + 1,
+        'RatingCriteria1': index % 5 + 1,
+        'RatingCriteria2': (index + 1) % 5 + 1,
+        'RatingCriteria3': (index + 2) % 5 + 1,
+        'UserExperience': 'This helped me pass a stone without much pain. ' * (index % 6 + 1),
+        'FoundHelpfulCount': index % 7,
+        'TotalVotedCount': index % 9,
+    }
+
+def build_review_page(reviews: List[dict], is_supplement: bool = True, total_reviews: int = 0,
+                      padding_blocks: int = 400, rating: float = 4.2) -> str:
+    """Build an HTML page with an __INITIAL_STATE__ payload and realistic surrounding markup."""
+    review_block = {'review_nimvs': reviews, 'totalreviews': total_reviews or len(reviews)}
+    if is_supplement:
+        state = {'vitamins_data': {'vitamin_review_nimvs': [review_block]}}
+    else:
+        state = {'drugs_data': {'drug_review_nimvs': [review_block]}}
+    # WebMD's state blob carries a lot of unrelated page data as well
+    state['page_config'] = {f'module_{i}': {'enabled': True, 'label': f'Module {i}'} for i in range(200)}
+
+    filler = ''.join(
+        f'<div class="card"><a href="/article/{i}">Related article {i}</a><p>Lorem ipsum dolor sit amet.</p></div>'
+        for i in range(padding_blocks)
+    )
+    ld_json = json.dumps({'@type': 'Product', 'aggregateRating': {
+        'ratingValue': rating, 'reviewCount': total_reviews or len(reviews)}})
+    return (
+        '<!DOCTYPE html><html><head><title>Reviews</title>'
+        f'<script type="application/ld+json">{ld_json}</script>'
+        '<script src="/static/app.js"></script></head><body>'
+        f'<div class="overall-rating"><span class="rat-num">{rating:.1f}</span></div>'
+        f'<ul class="tabs"><li class="active-tab"><a>Reviews <span>({total_reviews or len(reviews)})</span></a></li></ul>'
+        f'{filler}'
+        f'<script>window.__INITIAL_STATE__={json.dumps(state)};</script>'
+        f'{filler}</body></html>'
+    )
+
+def build_index_page(supplements: List[dict], padding_blocks: int = 200) -> str:
+    """Build an alphabetical index page linking to each supplement's monograph."""
+    filler = ''.join(f'<div class="promo"><a href="/news/{i}">Health news {i}</a></div>' for i in range(padding_blocks))
+    links = ''.join(
+        f'<li><a href="/vitamins/ai/ingredientmono-{supplement["id"]}/{supplement["slug"]}">{supplement["name"]}</a></li>'
+        for supplement in supplements
+    )
+    return f'<!DOCTYPE html><html><body>{filler}<ul class="alpha-list">{links}</ul>{filler}</body></html>'
@@ -0,0 +1,208 @@
+"""Offline end-to-end benchmark of the WebMD scrapers against the local fixture server.
+
+Runs WebMDSupplementIndexScraper, WebMDSupplementRatingsScraper and
+WebMDReviewScraper against fixture_server.py and reports pages/sec, parse
+time per page, peak RSS and p50/p99 latency per stage.
+
+Usage:
+    python benchmarks/webmd_bench.py --latency-ms 50 --error-rate 0.02
+    python benchmarks/webmd_bench.py --json bench_output.json
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from fixture_server import FixtureServer
+from webmd_http import WebMDClient
+from webmd_ratelimit import AdaptiveRateLimiter
+
+# The scraper scripts have hyphenated file names, so they are imported by module name
+index_module = importlib.import_module('webmd-supplement-index-scraper')
+ratings_module = importlib.import_module('webmd-ratings-scraper')
+reviews_module = importlib.import_module('webmd-scraper-all-supplements')
+
+class StageStats:
+    """Thread-safe latency samples per stage."""
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self.lock:
+            self.samples[stage].append(seconds)
+
+    @staticmethod
+    def percentile(values: List[float], q: float) -> float:
+        ordered = sorted(values)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def summary(self) -> Dict[str, dict]:
+        return {
+            stage: {
+                'count': len(values),
+                'p50_ms': self.percentile(values, 0.50) * 1000,
+                'p99_ms': self.percentile(values, 0.99) * 1000,
+                'total_s': sum(values),
+            }
+            for stage, values in sorted(self.samples.items()) if values
+        }
+
+class FixtureClient(WebMDClient):
+    """Client that reroutes WebMD URLs to the fixture server and accumulates fetch time per thread."""
+    def __init__(self, server_url: str, rate_limiter: Optional[AdaptiveRateLimiter] = None):
+        super().__init__(pool_size=32, timeout=10.0, backoff_factor=0.01, rate_limiter=rate_limiter)
+        self.server_url = server_url
+        self.local = threading.local()
+        self.bytes_downloaded = 0
+
+    def route(self, url: str) -> str:
+        parts = urlsplit(url)
+        return f"{self.server_url}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else '')
+
+    def get(self, url: str, **kwargs):
+        start = time.perf_counter()
+        response = super().get(self.route(url), **kwargs)
+        self.local.fetch_time = getattr(self.local, 'fetch_time', 0.0) + time.perf_counter() - start
+        self.bytes_downloaded += len(response.content)
+        return response
+
+    def invalidate(self, url: str):
+        super().invalidate(self.route(url))
+
+def instrument(stats: StageStats, client: FixtureClient, stage: str, func: Callable) -> Callable:
+    """Wrap a per-page scraper method, splitting its time into fetch and parse."""
+    def wrapper(*args, **kwargs):
+        client.local.fetch_time = 0.0
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            total = time.perf_counter() - start
+            stats.record(f'{stage}.fetch', client.local.fetch_time)
+            stats.record(f'{stage}.parse', total - client.local.fetch_time)
+    return wrapper
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_stage(name: str, stats: StageStats, func: Callable, verbose: bool) -> dict:
+    """Run one scraper end to end and summarize its throughput."""
+    pages_before = sum(len(v) for k, v in stats.samples.items() if k.endswith('.fetch'))
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    with output:
+        func()
+    wall = time.perf_counter() - start
+    pages = sum(len(v) for k, v in stats.samples.items() if k.endswith('.fetch')) - pages_before
+    parse = stats.samples.get(f'{name}.parse', [])
+    return {
+        'pages': pages,
+        'wall_s': wall,
+        'pages_per_s': pages / wall if wall else 0.0,
+        'parse_ms_per_page': sum(parse) / len(parse) * 1000 if parse else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Server latency per request')
+    parser.add_argument('--jitter-ms', type=float, default=5.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--supplements-per-letter', type=int, default=2)
+    parser.add_argument('--review-targets', type=int, default=4, help='Number of review targets to scrape')
+    parser.add_argument('--workers', type=int, default=8, help='WebMDReviewScraper worker threads')
+    parser.add_argument('--rate-limit', type=float, metavar='MAX_RATE',
+                        help='Pace requests with the adaptive rate limiter, capped at this many requests/second')
+    parser.add_argument('--pages-dir', help='Recorded pages that override the generated fixtures')
+    parser.add_argument('--json', help='Write the report to this JSON file as well')
+    parser.add_argument('--verbose', action='store_true', help="Show the scrapers' own output")
+    args = parser.parse_args()
+
+    server = FixtureServer(args.latency_ms, args.jitter_ms, args.error_rate,
+                           args.supplements_per_letter, args.pages_dir).start()
+    rate_limiter = AdaptiveRateLimiter(initial_rate=args.rate_limit / 4, max_rate=args.rate_limit) if args.rate_limit else None
+    client = FixtureClient(server.url, rate_limiter)
+    stats = StageStats()
+
+    index_scraper = index_module.WebMDSupplementIndexScraper(client=client)
+    index_scraper.get_supplements_from_page = instrument(
+        stats, client, 'index', index_scraper.get_supplements_from_page)
+    ratings_scraper = ratings_module.WebMDSupplementRatingsScraper(client=client)
+    ratings_scraper.fetch_review_page_ratings = instrument(
+        stats, client, 'ratings', ratings_scraper.fetch_review_page_ratings)
+    review_scraper = reviews_module.WebMDReviewScraper(max_workers=args.workers, client=client)
+    review_scraper.get_page_with_count = instrument(stats, client, 'reviews', review_scraper.get_page_with_count)
+
+    targets = []
+    for i in range(args.review_targets):
+        item_id = 100 + i
+        if i % 2:
+            base_url = f"https://reviews.webmd.com/drugs/drugreview-{item_id}-drug-{item_id}-oral"
+        else:
+            base_url = f"https://reviews.webmd.com/vitamins-supplements/ingredientreview-{item_id}-SUPPLEMENT-{item_id}"
+        targets.append(reviews_module.ReviewTarget(f'Target {item_id}', base_url, '', not i % 2))
+
+    def scrape_reviews():
+        results = review_scraper.scrape_targets(targets)
+        start = time.perf_counter()
+        reviews_module.save_to_csv([r for t in targets for r in results[t.name]], 'webmd_reviews.csv')
+        stats.record('reviews.write', time.perf_counter() - start)
+
+    workdir = tempfile.mkdtemp(prefix='webmd-bench-')
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        scrapers = {
+            'index': run_stage('index', stats, index_scraper.scrape_all_supplement_urls, args.verbose),
+            'ratings': run_stage('ratings', stats, lambda: ratings_scraper.scrape_all_ratings(
+                'webmd_supplement_urls.csv', 'webmd_supplement_ratings.csv'), args.verbose),
+            'reviews': run_stage('reviews', stats, scrape_reviews, args.verbose),
+        }
+    finally:
+        os.chdir(previous_dir)
+        server.stop()
+
+    report = {
+        'config': vars(args),
+        'scrapers': scrapers,
+        'stages': stats.summary(),
+        'requests_served': server.requests_served,
+        'errors_injected': server.errors_injected,
+        'bytes_downloaded': client.bytes_downloaded,
+        'rate_limit': rate_limiter.metrics() if rate_limiter else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+    print(f"{'scraper':<10}{'pages':>8}{'wall s':>10}{'pages/s':>10}{'parse ms/pg':>14}{'peak RSS MB':>14}")
+    for name, result in scrapers.items():
+        print(f"{name:<10}{result['pages']:>8}{result['wall_s']:>10.2f}{result['pages_per_s']:>10.1f}"
+              f"{result['parse_ms_per_page']:>14.2f}{result['peak_rss_mb']:>14.1f}")
+    print(f"\n{'stage':<20}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for stage, result in report['stages'].items():
+        print(f"{stage:<20}{result['count']:>8}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}")
+    print(f"\n{server.requests_served} requests served, {server.errors_injected} errors injected, "
+          f"{client.bytes_downloaded / 1e6:.1f} MB downloaded")
+    if rate_limiter:
+        print(rate_limiter.report())
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
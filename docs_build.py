@@ -0,0 +1,218 @@
+r"""Incremental build of the docs/ tables and figures.
+
+Each output is fingerprinted from its inputs: the review sheet it reads (CSV or Parquet
+partition contents), its filter case, the site's medicine mapping and exclusions, the
+analyzed columns and the code that renders it. Outputs whose fingerprint matches the
+manifest of the last build are skipped; the rest are rebuilt in parallel processes, one
+job per site's tables or per figure. The manifest records what was rebuilt and why.
+
+Usage:
+    python docs_build.py                 # rebuild what changed
+    python docs_build.py --dry-run       # only list what would be rebuilt and why
+    python docs_build.py --force --jobs 4
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from parquet_store import DEFAULT_ROOT, KIDNEY_STONE_REVIEWS
+from review_tables import (COLUMNS_TO_ANALYZE, SITE_TABLES, TABLE_CASES, TABLE_FILTERS, display_table, load_sheet,
+                           sheet_csv_path, weighted_percentages)
+from webmd_instrument import add_instrumentation_args, get_recorder, instrumented_run
+
+DEFAULT_MANIFEST = '.docs_build.json'
+RATING_FIGURE_COLUMNS = ['Medicine', 'Overall Rating']
+
+@dataclass
+class DocTarget:
+    output: str             # Path of the built file
+    job: Tuple[str, str]    # Targets with the same job are built together, e.g. ('tables', 'WebMD')
+    inputs: Dict[str, str]  # Input name -> fingerprint
+
+def fingerprint(value) -> str:
+    """Stable hash of a JSON-serializable value."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+def hash_files(paths: List[str]) -> str:
+    """Hash of the contents of files, or 'missing' if there are none."""
+    if not paths:
+        return 'missing'
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(path.encode('utf-8'))
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def sheet_fingerprint(site: str, root: str, csv_dir: str) -> str:
+    """Fingerprint of the sheet load_sheet would read: the site's Parquet partition if built, else its CSV."""
+    dataset = os.path.join(root, KIDNEY_STONE_REVIEWS)
+    if os.path.exists(dataset):
+        return hash_files(glob.glob(os.path.join(dataset, f'source={site.lower()}', '**', '*.parquet'), recursive=True))
+    path = sheet_csv_path(site, csv_dir)
+    return hash_files([path] if os.path.exists(path) else [])
+
+def code_fingerprint(*modules: str) -> str:
+    """Fingerprint of the modules that render an output, so code changes rebuild it too."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    return hash_files([os.path.join(here, module) for module in modules])
+
+def plan(output_dir: str, root: str, csv_dir: str) -> List[DocTarget]:
+    """Every docs output with the fingerprints of its inputs."""
+    targets = []
+    table_code = code_fingerprint('review_tables.py')
+    for site, config in SITE_TABLES.items():
+        sheet = sheet_fingerprint(site, root, csv_dir)
+        for case, suffix in TABLE_CASES.items():
+            targets.append(DocTarget(
+                os.path.join(output_dir, f"{config.prefix}-table-full-analysis{suffix}.html"), ('tables', site), {
+                    'sheet': sheet,
+                    'case': fingerprint(TABLE_FILTERS[case]),
+                    'mapping': fingerprint(config.medicine_mapping),
+                    'exclusions': fingerprint(config.medicines_to_exclude),
+                    'weights': fingerprint(config.weighted),
+                    'columns': fingerprint(COLUMNS_TO_ANALYZE),
+                    'code': table_code,
+                }))
+    targets.append(DocTarget(
+        os.path.join(output_dir, 'webmd-treatment-distribution-rating.png'), ('rating_figure', 'WebMD'), {
+            'sheet': sheet_fingerprint('WebMD', root, csv_dir),
+            'code': code_fingerprint('review_figures.py'),
+        }))
+    return targets
+
+def stale_reason(target: DocTarget, previous: Optional[dict]) -> Optional[str]:
+    """Why target needs rebuilding, or None if it is up to date."""
+    if previous is None:
+        return 'new target'
+    if previous.get('status') == 'failed':
+        return 'failed last time'
+    if not os.path.exists(target.output):
+        return 'output missing'
+    changed = [name for name, value in target.inputs.items() if previous.get('inputs', {}).get(name) != value]
+    if changed:
+        return f"{', '.join(changed)} changed"
+    return None
+
+def _write_atomic(path: str, write):
+    """Write through a temporary file, so an interrupted build never leaves a half-written output."""
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{ext}"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def build_job(job: Tuple[str, str], outputs: List[str], root: str, csv_dir: str) -> float:
+    """Build one job's outputs in a worker process; returns the seconds it took."""
+    start = time.perf_counter()
+    kind, site = job
+    if kind == 'tables':
+        config = SITE_TABLES[site]
+        paths = {os.path.basename(path): path for path in outputs}
+        cases = {case: TABLE_FILTERS[case] for case, suffix in TABLE_CASES.items()
+                 if f"{config.prefix}-table-full-analysis{suffix}.html" in paths}
+        # One aggregation covers every stale case of the site
+        stats = weighted_percentages({site: load_sheet(site, root, csv_dir)}, cases=cases)
+        for case in cases:
+            path = paths[f"{config.prefix}-table-full-analysis{TABLE_CASES[case]}.html"]
+            _write_atomic(path, display_table(stats, site, case).to_html)
+    elif kind == 'rating_figure':
+        # Plotly (and kaleido for images) are only needed when a figure is rebuilt
+        from review_figures import create_grouped_rating_distribution, write_figure
+        fig = create_grouped_rating_distribution(load_sheet(site, root, csv_dir, columns=RATING_FIGURE_COLUMNS))
+        for path in outputs:
+            _write_atomic(path, lambda tmp_path: write_figure(fig, tmp_path))
+    else:
+        raise ValueError(f"Unknown build job {kind}")
+    return time.perf_counter() - start
+
+def load_manifest(path: str) -> dict:
+    if not os.path.exists(path):
+        return {'targets': {}}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest: dict, path: str):
+    def write(tmp_path: str):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+    _write_atomic(path, write)
+
+def build_docs(output_dir: str = 'docs', root: str = DEFAULT_ROOT, csv_dir: str = 'csv-files',
+               manifest_path: str = DEFAULT_MANIFEST, jobs: Optional[int] = None, force: bool = False,
+               dry_run: bool = False) -> dict:
+    """Rebuild the stale docs outputs and return the updated manifest."""
+    recorder = get_recorder()
+    manifest = load_manifest(manifest_path)
+    with recorder.stage('plan'):
+        targets = plan(output_dir, root, csv_dir)
+    reasons = {target.output: 'forced' if force else stale_reason(target, manifest['targets'].get(target.output))
+               for target in targets}
+
+    stale: Dict[Tuple[str, str], List[DocTarget]] = {}
+    for target in targets:
+        if reasons[target.output] is None:
+            continue
+        if target.inputs.get('sheet') == 'missing':
+            print(f"Skipping {target.output}: no {target.job[1]} review sheet in {root} or {csv_dir}")
+            continue
+        stale.setdefault(target.job, []).append(target)
+    print(f"{sum(map(len, stale.values()))} of {len(targets)} docs outputs to rebuild")
+    for job_targets in stale.values():
+        for target in job_targets:
+            print(f"  {target.output}: {reasons[target.output]}")
+    if dry_run or not stale:
+        return manifest
+
+    rebuilding = {target.output for job_targets in stale.values() for target in job_targets}
+    run = {'started_at': datetime.now().isoformat(timespec='seconds'), 'rebuilt': [], 'failed': [],
+           'skipped': [target.output for target in targets if target.output not in rebuilding]}
+    with recorder.stage('build'), ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {job: executor.submit(build_job, job, [target.output for target in job_targets], root, csv_dir)
+                   for job, job_targets in stale.items()}
+        for job, future in futures.items():
+            try:
+                seconds, error = future.result(), None
+            except Exception as e:
+                seconds, error = None, f"{type(e).__name__}: {e}"
+                print(f"Failed to build {job[0]} for {job[1]}: {error}")
+            for target in stale[job]:
+                manifest['targets'][target.output] = {
+                    'status': 'failed' if error else 'built',
+                    'reason': reasons[target.output],
+                    'inputs': target.inputs,
+                    'job_seconds': seconds,
+                    'error': error,
+                    'built_at': run['started_at'],
+                }
+                run['failed' if error else 'rebuilt'].append(target.output)
+    manifest['last_run'] = run
+    save_manifest(manifest, manifest_path)
+    print(f"Rebuilt {len(run['rebuilt'])}, failed {len(run['failed'])}, up to date {len(run['skipped'])}; "
+          f"manifest saved to {manifest_path}")
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output-dir', default='docs', help='Where the tables and figures are written')
+    parser.add_argument('--root', default=DEFAULT_ROOT, help='Parquet dataset directory, used when it has been built')
+    parser.add_argument('--csv-dir', default='csv-files', help='Directory with the "Kidney Stone Reviews - Reviews - *.csv" sheets')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST, help='Build manifest (fingerprints and rebuild reasons)')
+    parser.add_argument('--jobs', type=int, help='Worker processes (default: one per CPU)')
+    parser.add_argument('--force', action='store_true', help='Rebuild everything')
+    parser.add_argument('--dry-run', action='store_true', help='List what would be rebuilt and why, without building')
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+
+    with instrumented_run('docs-build', args.report, args.profile):
+        build_docs(args.output_dir, args.root, args.csv_dir, args.manifest, args.jobs, args.force, args.dry_run)
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,14 @@
 import pandas as pd
-from difflib import SequenceMatcher
-
-def normalize_text(text):
-    if pd.isna(text):
-        return ''
-    return str(text).lower().replace('\n', ' ').strip()
-
-def similarity_ratio(a, b):
-    return SequenceMatcher(None, normalize_text(a), normalize_text(b)).ratio()
+from near_duplicates import NearDuplicateFinder, find_duplicate_pairs
 
 # Read both CSVs
 original_df = pd.read_csv('Amazon original.csv')
 scraped_df = pd.read_csv('Amazon scraped.csv')
 
-duplicates = []
-for _, orig_row in original_df.iterrows():
-    for _, scrap_row in scraped_df.iterrows():
-        similarity = similarity_ratio(orig_row['Review'], scrap_row['text'])
-        if similarity > 0.8:  # Threshold can be adjusted
-            duplicates.append({
-                'original_id': orig_row['ID'],
-                'scraped_id': scrap_row['ID'],
-                'similarity': similarity
-            })
+# MinHash/LSH picks candidate pairs; only those get the exact similarity check
+finder = NearDuplicateFinder(threshold=0.8)  # Threshold can be adjusted
+duplicates = find_duplicate_pairs(original_df, 'Review', 'ID', scraped_df, 'text', 'ID', finder=finder)
+print(finder.stats.summary())
 
 # Output results
-pd.DataFrame(duplicates).to_csv('duplicate_pairs.csv', index=False)
\ No newline at end of file
+duplicates.rename(columns={'left_id': 'original_id', 'right_id': 'scraped_id'}).to_csv('duplicate_pairs.csv', index=False)
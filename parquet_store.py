@@ -0,0 +1,169 @@
+r"""Typed Parquet dataset store for scraped reviews, supplement ratings and the curated review sheets.
+
+Layout under the store root (default: dataset/):
+    webmd_reviews/source=webmd/medicine=<target>/...    reviews from webmd-scraper-all-supplements.py
+    kidney_stone_reviews/source=<site>/medicine=<med>/...  the csv-files/Kidney Stone Reviews sheets
+    supplement_ratings.parquet                          output of webmd-ratings-scraper.py
+
+Usage:
+    python parquet_store.py --reviews webmd_all_reviews_black_seed_garcinia.csv \
+        --ratings webmd_supplement_ratings.csv --kidney-stone-dir csv-files
+"""
+import argparse
+import os
+from typing import Iterable, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed when the Parquet store is used
+    pa = None
+
+DEFAULT_ROOT = 'dataset'
+WEBMD_REVIEWS = 'webmd_reviews'
+KIDNEY_STONE_REVIEWS = 'kidney_stone_reviews'
+SUPPLEMENT_RATINGS = 'supplement_ratings.parquet'
+KIDNEY_STONE_SITES = ('WebMD', 'Amazon', 'Reddit')
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("The Parquet store needs pyarrow: pip install pyarrow")
+
+def review_schema() -> 'pa.Schema':
+    """Stable schema for the fields produced by WebMDReviewScraper.parse_review."""
+    _require_pyarrow()
+    category = pa.dictionary(pa.int16(), pa.string())
+    return pa.schema([
+        ('source', pa.string()),
+        ('medicine', pa.string()),
+        ('author_name', pa.string()),
+        ('age_range', category),
+        ('time_on_treatment', category),
+        ('condition', category),
+        ('review_date', pa.date32()),
+        ('overall_rating', pa.float64()),
+        ('effectiveness', pa.int8()),
+        ('ease_of_use', pa.int8()),
+        ('satisfaction', pa.int8()),
+        ('review_text', pa.string()),
+        ('helpful_votes', pa.int32()),
+        ('total_votes', pa.int32()),
+    ])
+
+def ratings_schema() -> 'pa.Schema':
+    _require_pyarrow()
+    return pa.schema([
+        ('name', pa.string()),
+        ('url', pa.string()),
+        ('letter', pa.string()),
+        ('rating', pa.float64()),
+        ('num_reviews', pa.int32()),
+    ])
+
+def _write_partitioned(table: 'pa.Table', path: str):
+    """Write a table partitioned by source and medicine, replacing the partitions it covers."""
+    partitioning = ds.partitioning(pa.schema([('source', pa.string()), ('medicine', pa.string())]), flavor='hive')
+    ds.write_dataset(table, path, format='parquet', partitioning=partitioning,
+                     existing_data_behavior='delete_matching')
+
+def normalize_reviews(reviews: pd.DataFrame, source: str = 'webmd') -> pd.DataFrame:
+    """Coerce parse_review rows (from memory or CSV) to the review schema's dtypes."""
+    df = reviews.rename(columns={'source': 'medicine'}).copy()
+    df['source'] = source
+    df['review_date'] = pd.to_datetime(df['review_date'], errors='coerce').dt.date
+    df['overall_rating'] = pd.to_numeric(df['overall_rating'], errors='coerce')
+    for col in ['effectiveness', 'ease_of_use', 'satisfaction']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int8')
+    for col in ['helpful_votes', 'total_votes']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('int32')
+    for col in ['author_name', 'age_range', 'time_on_treatment', 'condition', 'review_text']:
+        df[col] = df[col].fillna('').astype(str)
+    return df[[field.name for field in review_schema()]]
+
+def write_webmd_reviews(reviews: pd.DataFrame, root: str = DEFAULT_ROOT):
+    """Store scraped WebMD reviews, replacing the partitions of the medicines they cover."""
+    table = pa.Table.from_pandas(normalize_reviews(reviews), schema=review_schema(), preserve_index=False)
+    _write_partitioned(table, os.path.join(root, WEBMD_REVIEWS))
+    print(f"Stored {table.num_rows} reviews in {os.path.join(root, WEBMD_REVIEWS)}")
+
+def write_supplement_ratings(ratings: pd.DataFrame, root: str = DEFAULT_ROOT):
+    """Store the supplement ratings table as a single typed Parquet file."""
+    _require_pyarrow()
+    df = ratings.copy()
+    df['rating'] = pd.to_numeric(df['rating'], errors='coerce')
+    df['num_reviews'] = pd.to_numeric(df['num_reviews'], errors='coerce').astype('Int32')
+    table = pa.Table.from_pandas(df[ratings_schema().names], schema=ratings_schema(), preserve_index=False)
+
+    os.makedirs(root, exist_ok=True)
+    pq.write_table(table, os.path.join(root, SUPPLEMENT_RATINGS))
+    print(f"Stored {table.num_rows} supplement ratings in {os.path.join(root, SUPPLEMENT_RATINGS)}")
+
+def write_kidney_stone_reviews(df: pd.DataFrame, site: str, root: str = DEFAULT_ROOT):
+    """Store one curated review sheet; dtypes are inferred once here instead of on every load."""
+    _require_pyarrow()
+    df = df.copy()
+    df['source'] = site.lower()
+    df['medicine'] = df['Medicine']
+    for col in df.columns[df.dtypes == object]:
+        # Mixed flag columns (1/0 plus free text) are stored as text, which is how read_csv loads them
+        df[col] = df[col].map(lambda value: value if pd.isna(value) or isinstance(value, str) else str(value))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    _write_partitioned(table, os.path.join(root, KIDNEY_STONE_REVIEWS))
+    print(f"Stored {table.num_rows} {site} reviews in {os.path.join(root, KIDNEY_STONE_REVIEWS)}")
+
+def _read_partitioned(path: str, columns: Optional[List[str]], source: Optional[str],
+                      medicines: Optional[Iterable[str]]) -> pd.DataFrame:
+    _require_pyarrow()
+    filters = []
+    if source is not None:
+        filters.append(('source', '==', source))
+    if medicines is not None:
+        filters.append(('medicine', 'in', list(medicines)))
+    if columns is not None:
+        # Sheets differ slightly between sites, so skip requested columns a dataset doesn't have
+        available = ds.dataset(path, partitioning='hive').schema.names
+        columns = [col for col in columns if col in available]
+    return pd.read_parquet(path, columns=columns, filters=filters or None)
+
+def load_webmd_reviews(root: str = DEFAULT_ROOT, columns: Optional[List[str]] = None,
+                       medicines: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Load scraped WebMD reviews, reading only the requested columns and medicine partitions."""
+    df = _read_partitioned(os.path.join(root, WEBMD_REVIEWS), columns, 'webmd', medicines)
+    if 'review_date' in df.columns:
+        df['review_date'] = pd.to_datetime(df['review_date'])
+    return df
+
+def load_kidney_stone_reviews(site: str, root: str = DEFAULT_ROOT, columns: Optional[List[str]] = None,
+                              medicines: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Load one site's curated reviews (WebMD, Amazon or Reddit), reading only the requested columns."""
+    df = _read_partitioned(os.path.join(root, KIDNEY_STONE_REVIEWS), columns, site.lower(), medicines)
+    # Partition columns come back as categoricals; the analysis expects plain values
+    return df.drop(columns=[col for col in ('source', 'medicine') if col in df.columns and col not in (columns or [])])
+
+def load_supplement_ratings(root: str = DEFAULT_ROOT, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    _require_pyarrow()
+    return pd.read_parquet(os.path.join(root, SUPPLEMENT_RATINGS), columns=columns)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--root', default=DEFAULT_ROOT, help='Dataset directory')
+    parser.add_argument('--reviews', nargs='*', default=[], help='Review CSVs written by save_to_csv')
+    parser.add_argument('--ratings', help='webmd_supplement_ratings.csv')
+    parser.add_argument('--kidney-stone-dir', help='Directory with the "Kidney Stone Reviews - Reviews - *.csv" sheets')
+    args = parser.parse_args()
+
+    for path in args.reviews:
+        write_webmd_reviews(pd.read_csv(path), args.root)
+    if args.ratings:
+        write_supplement_ratings(pd.read_csv(args.ratings), args.root)
+    if args.kidney_stone_dir:
+        for site in KIDNEY_STONE_SITES:
+            path = os.path.join(args.kidney_stone_dir, f'Kidney Stone Reviews - Reviews - {site}.csv')
+            if os.path.exists(path):
+                write_kidney_stone_reviews(pd.read_csv(path), site, args.root)
+
+if __name__ == "__main__":
+    main()
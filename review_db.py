@@ -0,0 +1,251 @@
+r"""Embedded SQLite store (WAL mode) for supplements, ratings snapshots and reviews.
+
+Tables:
+    supplements  one row per WebMD supplement URL, from the index and ratings scrapers
+    ratings      one snapshot per supplement URL and day, from webmd-ratings-scraper.py
+    reviews      scraped and curated reviews keyed by (source, medicine, review_key)
+
+Scraped reviews are keyed by review_key (date, author and a hash of the text), so
+reruns update rows instead of duplicating them. The curated csv-files sheets are
+imported whole under their own source (sheet:webmd, sheet:amazon, sheet:reddit), so
+re-importing a site's sheet replaces that sheet's rows and leaves scraped reviews alone.
+
+Usage:
+    python review_db.py --reviews webmd_all_reviews_black_seed_garcinia.csv \
+        --ratings webmd_supplement_ratings.csv --kidney-stone-dir csv-files
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import date
+from typing import Iterable, List, Optional
+
+import pandas as pd
+
+DEFAULT_DB = 'reviews.sqlite'
+KIDNEY_STONE_SITES = ('WebMD', 'Amazon', 'Reddit')
+SHEET_SOURCE_PREFIX = 'sheet:'
+
+REVIEW_FIELDS = ['author_name', 'age_range', 'time_on_treatment', 'condition', 'review_date', 'overall_rating',
+                 'effectiveness', 'ease_of_use', 'satisfaction', 'review_text', 'helpful_votes', 'total_votes']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS supplements (
+    url TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    letter TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ratings (
+    url TEXT NOT NULL,
+    scraped_on TEXT NOT NULL,
+    rating REAL,
+    num_reviews INTEGER,
+    PRIMARY KEY (url, scraped_on)
+);
+CREATE TABLE IF NOT EXISTS reviews (
+    source TEXT NOT NULL,
+    medicine TEXT NOT NULL,
+    review_key TEXT NOT NULL,
+    author_name TEXT,
+    age_range TEXT,
+    time_on_treatment TEXT,
+    condition TEXT,
+    review_date TEXT,
+    overall_rating REAL,
+    effectiveness INTEGER,
+    ease_of_use INTEGER,
+    satisfaction INTEGER,
+    review_text TEXT,
+    helpful_votes INTEGER,
+    total_votes INTEGER,
+    extra TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    PRIMARY KEY (source, medicine, review_key)
+);
+CREATE INDEX IF NOT EXISTS reviews_medicine ON reviews (medicine);
+CREATE INDEX IF NOT EXISTS reviews_condition ON reviews (condition);
+CREATE INDEX IF NOT EXISTS reviews_review_date ON reviews (review_date);
+"""
+
+def review_key(review: dict) -> str:
+    """Natural key of a parsed review: date, author and a hash of the text."""
+    text_hash = hashlib.sha1(str(review['review_text']).encode('utf-8')).hexdigest()[:12]
+    return f"{review['review_date']}|{review['author_name']}|{text_hash}"
+
+def sheet_source(site: str) -> str:
+    """Source of a site's curated sheet rows, kept apart from the reviews scraped from that site."""
+    return f'{SHEET_SOURCE_PREFIX}{site.lower()}'
+
+def _number(value, kind=float):
+    """Convert a CSV or JSON value to a number, or None when it is empty or not numeric."""
+    if value is None or value == '':
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if number != number:  # NaN
+        return None
+    return kind(number)
+
+class ReviewDB:
+    """Connection to the review store; safe to share between the scraper threads."""
+    def __init__(self, path: str = DEFAULT_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets the notebook and analysis read while a scraper is writing
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        # Sheets imported before they had their own source were stored under the bare site name
+        self.db.execute("UPDATE reviews SET source = ? || source WHERE extra IS NOT NULL AND source NOT LIKE ?",
+                        (SHEET_SOURCE_PREFIX, f'{SHEET_SOURCE_PREFIX}%'))
+        self.db.commit()
+
+    def upsert_supplements(self, supplements: pd.DataFrame):
+        """Insert or refresh supplements from a name/url/letter table such as webmd_supplement_urls.csv."""
+        today = date.today().isoformat()
+        rows = [(row.url, row.name, getattr(row, 'letter', None), today, today)
+                for row in supplements.itertuples(index=False) if isinstance(row.url, str)]
+        with self.lock:
+            self.db.executemany("""
+                INSERT INTO supplements VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    name = excluded.name, letter = COALESCE(excluded.letter, letter), last_seen = excluded.last_seen
+            """, rows)
+            self.db.commit()
+
+    def record_ratings(self, ratings: pd.DataFrame, scraped_on: Optional[str] = None):
+        """Store today's ratings snapshot (one row per supplement URL); a rerun on the same day replaces it."""
+        scraped_on = scraped_on or date.today().isoformat()
+        self.upsert_supplements(ratings)
+        rows = [(row.url, scraped_on, _number(row.rating), _number(row.num_reviews, int))
+                for row in ratings.itertuples(index=False) if isinstance(row.url, str)]
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO ratings VALUES (?, ?, ?, ?)", rows)
+            self.db.commit()
+        print(f"Recorded {len(rows)} ratings for {scraped_on} in {self.path}")
+
+    def upsert_reviews(self, reviews: Iterable[dict], source: str = 'webmd') -> int:
+        """Bulk insert parsed reviews, updating vote counts and other fields of reviews already stored."""
+        today = date.today().isoformat()
+        rows = []
+        for review in reviews:
+            values = [review.get(field) for field in REVIEW_FIELDS]
+            values[5] = _number(values[5])
+            values[6:9] = [_number(value, int) for value in values[6:9]]
+            values[10:12] = [_number(value, int) or 0 for value in values[10:12]]
+            rows.append((source, review['source'], review_key(review), *values, None, today, today))
+
+        with self.lock:
+            self.db.executemany(f"""
+                INSERT INTO reviews VALUES ({', '.join('?' * (len(REVIEW_FIELDS) + 6))})
+                ON CONFLICT (source, medicine, review_key) DO UPDATE SET
+                    {', '.join(f'{field} = excluded.{field}' for field in REVIEW_FIELDS)},
+                    last_seen = excluded.last_seen
+            """, rows)
+            self.db.commit()
+        return len(rows)
+
+    def replace_sheet_reviews(self, sheet: pd.DataFrame, site: str):
+        """Replace a site's curated reviews with the rows of its sheet, keeping every column in `extra`."""
+        source = sheet_source(site)
+        today = date.today().isoformat()
+        records = sheet.astype(object).where(sheet.notna(), None).to_dict('records')
+        rows = [(source, str(record.get('Medicine') or ''), f'row-{i}', *([None] * len(REVIEW_FIELDS)),
+                 json.dumps(record, default=str), today, today)
+                for i, record in enumerate(records)]
+
+        with self.lock:
+            self.db.execute("DELETE FROM reviews WHERE source = ?", (source,))
+            self.db.executemany(f"INSERT INTO reviews VALUES ({', '.join('?' * (len(REVIEW_FIELDS) + 6))})", rows)
+            self.db.commit()
+        print(f"Stored {len(rows)} {site} reviews in {self.path}")
+
+    def query_reviews(self, source: Optional[str] = None, medicines: Optional[Iterable[str]] = None,
+                      conditions: Optional[Iterable[str]] = None, since: Optional[str] = None,
+                      until: Optional[str] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Load the reviews matching the filters; curated sheet columns are expanded from `extra`.
+
+        `source` is 'webmd' for scraped reviews or sheet_source(site) for a curated sheet.
+        """
+        clauses, params = [], []
+        if source is not None:
+            clauses.append("source = ?")
+            params.append(source.lower())
+        for column, values in (('medicine', medicines), ('condition', conditions)):
+            if values is not None:
+                values = list(values)
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        if since is not None:
+            clauses.append("review_date >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("review_date <= ?")
+            params.append(until)
+
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self.lock:
+            df = pd.read_sql_query(f"SELECT * FROM reviews{where} ORDER BY rowid", self.db, params=params)
+
+        extra = df.pop('extra')
+        if extra.notna().any():
+            sheet = pd.DataFrame([json.loads(value) if isinstance(value, str) else {} for value in extra], index=df.index)
+            df = df.join(sheet[[col for col in sheet.columns if col not in df.columns]])
+            # Sheet rows only carry their own columns
+            if extra.notna().all():
+                df = df.drop(columns=REVIEW_FIELDS)
+        if columns is not None:
+            df = df[[col for col in columns if col in df.columns]]
+        return df
+
+    def latest_ratings(self) -> pd.DataFrame:
+        """Each supplement with its most recent ratings snapshot, in the layout of webmd_supplement_ratings.csv."""
+        with self.lock:
+            return pd.read_sql_query("""
+                SELECT s.name, s.url, s.letter, r.rating, r.num_reviews
+                FROM supplements s
+                LEFT JOIN ratings r ON r.url = s.url
+                    AND r.scraped_on = (SELECT MAX(scraped_on) FROM ratings WHERE url = s.url)
+                ORDER BY s.rowid
+            """, self.db)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DEFAULT_DB, help='SQLite database file')
+    parser.add_argument('--reviews', nargs='*', default=[], help='Review CSVs written by save_to_csv')
+    parser.add_argument('--supplements', help='webmd_supplement_urls.csv')
+    parser.add_argument('--ratings', help='webmd_supplement_ratings.csv, stored as a snapshot for --scraped-on')
+    parser.add_argument('--scraped-on', help='Snapshot date for --ratings (default: today)')
+    parser.add_argument('--kidney-stone-dir', help='Directory with the "Kidney Stone Reviews - Reviews - *.csv" sheets')
+    args = parser.parse_args()
+
+    db = ReviewDB(args.db)
+    for path in args.reviews:
+        reviews = pd.read_csv(path, dtype=str, keep_default_na=False).to_dict('records')
+        print(f"Stored {db.upsert_reviews(reviews)} reviews from {path} in {args.db}")
+    if args.supplements:
+        db.upsert_supplements(pd.read_csv(args.supplements))
+    if args.ratings:
+        db.record_ratings(pd.read_csv(args.ratings), args.scraped_on)
+    if args.kidney_stone_dir:
+        for site in KIDNEY_STONE_SITES:
+            path = os.path.join(args.kidney_stone_dir, f'Kidney Stone Reviews - Reviews - {site}.csv')
+            if os.path.exists(path):
+                db.replace_sheet_reviews(pd.read_csv(path), site)
+    db.close()
+
+if __name__ == "__main__":
+    main()
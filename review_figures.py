@@ -0,0 +1,89 @@
+"""Plotly figures of the curated kidney stone review sheets, shared by the notebook and docs_build.py."""
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+PLOT_PARAMS = {
+    'width': 400,
+    'height': 200,
+    'margin': dict(l=50, r=50, t=50, b=50),
+    'title_font_size': 14
+}
+
+def create_grouped_rating_distribution(df):
+    """Create a grouped bar plot comparing rating distributions across medicines."""
+    all_data = []
+    for medicine in sorted(df['Medicine'].unique()):
+        medicine_data = df[df['Medicine'] == medicine]
+        total_count = len(medicine_data)
+        bins = [1.0, 2.0, 3.0, 4.0, 5.0, 5.1]
+        counts, _ = np.histogram(medicine_data['Overall Rating'], bins=bins)
+
+        percentages = (counts / total_count) * 100
+        ratings_df = pd.DataFrame({
+            'Rating': [1, 2, 3, 4, 5],
+            'Percentage': percentages,
+            'Medicine': medicine,
+            'RatingRange': ['[1,2)', '[2,3)', '[3,4)', '[4,5)', '5'],
+            'Count': counts,
+            'TotalCount': total_count
+        })
+        all_data.append(ratings_df)
+
+    plot_df = pd.concat(all_data)
+
+    fig = px.bar(plot_df,
+                 x='Rating',
+                 y='Percentage',
+                 color='Medicine',
+                 barmode='group',
+                 width=PLOT_PARAMS['width'] * 2.0,
+                 height=PLOT_PARAMS['height']* 2.0,)
+
+    fig.update_layout(
+        title='Distribution of ratings by product (percentage)',
+        xaxis_title='Rating',
+        yaxis_title='Percentage of Reviews',
+        template='plotly_white',
+        bargap=0.15,
+        bargroupgap=0.1,
+        margin=PLOT_PARAMS['margin'],
+        title_font_size=PLOT_PARAMS['title_font_size'],
+        xaxis=dict(
+            tickmode='array',
+            tickvals=[1, 2, 3, 4, 5],
+            ticktext=['[1,2)', '[2,3)', '[3,4)', '[4,5)', '5'],
+            range=[0.5, 5.5]
+        ),
+        legend=dict(
+            orientation='h',
+            yanchor='top',
+            y=-0.25,
+            xanchor='center',
+            x=0.5,
+            title=None
+        ),
+        # autosize=True,
+    )
+
+    for medicine_name in plot_df['Medicine'].unique():
+        medicine_data = plot_df[plot_df['Medicine'] == medicine_name]
+        fig.update_traces(
+            customdata=medicine_data[['Medicine', 'RatingRange']].values,
+            hovertemplate=(
+                "%{customdata[0]}<br>" +
+                "Rating: %{customdata[1]}<br>" +
+                "Percentage: %{y:.1f}%" +
+                "<extra></extra>"
+            ),
+            selector=dict(name=medicine_name)
+        )
+
+    return fig
+
+def write_figure(fig, path: str):
+    """Save a figure as a static image (via kaleido) or, for .html paths, as an interactive page."""
+    if path.endswith('.html'):
+        fig.write_html(path)
+    else:
+        fig.write_image(path, scale=4)
@@ -0,0 +1,116 @@
+"""Columnar normalization of WebMD review pages.
+
+review_frame turns a batch of pages' raw review_nimvs lists into one DataFrame with compact
+dtypes (categoricals for the repeated labels and the YYYY-MM-DD dates, small ints for ratings
+and votes) instead of one parse_review dict per review. Dates are parsed once per distinct
+timestamp, with a vectorized pandas parser. Building a frame has a fixed cost, so pages are
+normalized in batches of a few thousand reviews (see iter_review_frames).
+"""
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from webmd_instrument import get_recorder
+
+DATE_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+
+# Output column -> (review_nimvs key, dtype); the columns and order of parse_review
+REVIEW_FIELDS = {
+    'author_name': ('DisplayName', 'string'),
+    'age_range': ('AgeRange', 'category'),
+    'time_on_treatment': ('TimeRange', 'category'),
+    'condition': ('SecondaryName_s', 'category'),
+    'review_date': ('DatePosted', 'date'),
+    'overall_rating': ('OverAll_UserReviewRating', 'float64'),  # Averages like 3.6666666666666665 need the full width
+    'effectiveness': ('RatingCriteria1', 'Int8'),
+    'ease_of_use': ('RatingCriteria2', 'Int8'),
+    'satisfaction': ('RatingCriteria3', 'Int8'),
+    'review_text': ('UserExperience', 'string'),
+    'helpful_votes': ('FoundHelpfulCount', 'int32'),
+    'total_votes': ('TotalVotedCount', 'int32'),
+}
+REVIEW_COLUMNS = ['source'] + list(REVIEW_FIELDS)
+
+def format_review_dates(values: Iterable) -> pd.Series:
+    """DatePosted values as YYYY-MM-DD, keeping unparseable values as they are (like format_review_date).
+
+    Each distinct value is parsed once. The result is an ordered categorical whose order is
+    that of the strings, so per-target newest dates compare as they do on the dict rows.
+    """
+    codes, uniques = pd.factorize(pd.Series(list(values), dtype=object))
+    uniques = pd.Series(uniques, dtype=object)
+    formatted = pd.to_datetime(uniques, format=DATE_FORMAT, errors='coerce').dt.strftime('%Y-%m-%d').astype(object)
+    labels = formatted.where(formatted.notna(), uniques)
+    categories = pd.Index(sorted(set(labels), key=str), dtype=object)
+    # Code -1 (missing) picks the -1 appended at the end, so it stays missing
+    label_codes = np.append(categories.get_indexer(labels), -1)
+    return pd.Series(pd.Categorical.from_codes(label_codes[codes], categories=categories, ordered=True))
+
+def _column(values: list, dtype: str) -> pd.Series:
+    if dtype == 'date':
+        return format_review_dates(values)
+    if dtype == 'category':
+        return pd.Series(pd.Categorical(['' if value is None else str(value) for value in values]))
+    if dtype == 'string':
+        return pd.Series(['' if value is None else str(value) for value in values], dtype='string')
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce')
+    if dtype == 'int32':  # Vote counts default to 0, as in parse_review
+        return numbers.fillna(0).astype('int32')
+    return numbers.astype(dtype)
+
+def review_frame(pages: List[Tuple[str, List[dict]]]) -> pd.DataFrame:
+    """Normalize (source, raw review_nimvs) pages to one typed frame with the columns of parse_review."""
+    page_codes, sources = pd.factorize(pd.Series([source for source, _ in pages], dtype=object))
+    codes = np.repeat(page_codes, [len(reviews) for _, reviews in pages])
+    reviews = [review for _, page_reviews in pages for review in page_reviews]
+
+    columns = {'source': pd.Series(pd.Categorical.from_codes(codes, categories=pd.Index(sources, dtype=object)))}
+    for column, (key, dtype) in REVIEW_FIELDS.items():
+        default = 0 if dtype == 'int32' else ''
+        columns[column] = _column([review.get(key, default) for review in reviews], dtype)
+    return pd.DataFrame(columns)
+
+def iter_review_frames(pages: Iterable[Tuple[str, List[dict]]], batch_size: int = 5000) -> Iterator[pd.DataFrame]:
+    """Group (source, raw reviews) pages into frames of at least batch_size reviews (the last may be smaller)."""
+    batch, rows = [], 0
+    for source, reviews in pages:
+        batch.append((source, reviews))
+        rows += len(reviews)
+        if rows >= batch_size:
+            with get_recorder().stage('parse'):
+                frame = review_frame(batch)
+            yield frame
+            batch, rows = [], 0
+    if rows:
+        with get_recorder().stage('parse'):
+            frame = review_frame(batch)
+        yield frame
+
+def concat_review_frames(frames: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate review frames, unioning the categories so categorical columns stay categorical."""
+    frames = list(frames)
+    if not frames:
+        return review_frame([])
+    categorical = [col for col in REVIEW_COLUMNS if isinstance(frames[0][col].dtype, pd.CategoricalDtype)]
+    for col in categorical:
+        ordered = frames[0][col].cat.ordered
+        categories = pd.api.types.union_categoricals([frame[col] for frame in frames], ignore_order=True).categories
+        if ordered:
+            categories = pd.Index(sorted(categories, key=str), dtype=object)
+        frames = [frame.assign(**{col: frame[col].cat.set_categories(categories, ordered=ordered)}) for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+def rating_value(value):
+    """An overall rating as parse_review leaves it: whole ratings as ints (WebMD's JSON writes 4, not 4.0), '' if missing."""
+    if value == '' or pd.isna(value):
+        return ''
+    return int(value) if float(value).is_integer() else float(value)
+
+def frame_to_records(frame: pd.DataFrame) -> List[dict]:
+    """Convert a review frame back to parse_review dicts (missing values as '')."""
+    df = frame.astype(object).where(frame.notna(), '')
+    for col in ('effectiveness', 'ease_of_use', 'satisfaction', 'helpful_votes', 'total_votes'):
+        df[col] = [value if value == '' else int(value) for value in df[col]]
+    df['overall_rating'] = [rating_value(value) for value in df['overall_rating']]
+    return df[REVIEW_COLUMNS].to_dict('records')
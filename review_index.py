@@ -0,0 +1,326 @@
+r"""In-memory inverted index over review text and conditions, with boolean and phrase queries.
+
+Reviews are tokenized once (lowercased runs of letters and digits). Each field keeps its
+postings as NumPy arrays: per term, the sorted ids of the reviews containing it, plus every
+(review, position) occurrence for phrase queries. Medicine, source, date and rating are kept
+as compact columns, so filters are array lookups on the matching ids. Queries return the
+row ids (positions in the indexed frame) in milliseconds instead of a pandas pass per question.
+
+Query syntax:
+    stones gravel                 both terms (AND is implied)
+    chanca OR chanka              either term
+    kidney NOT gallbladder        NOT excludes
+    "breaking the stones"         phrase
+    dissolv*                      prefix
+    condition:"kidney stones"     only in the condition (text: only in the review text;
+                                  unprefixed terms match either)
+    (break* OR crush*) AND stone*
+
+Usage:
+    python review_index.py --db reviews.sqlite '"passed the stone" OR "passed a stone"' \
+        --medicine "Chanca Piedra" --since 2020-01-01 --min-rating 4 --show 5
+    python review_index.py --reviews webmd_all_reviews_black_seed_garcinia.csv 'dissolv*' --count-by medicine
+"""
+import argparse
+import itertools
+import json
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from review_db import DEFAULT_DB
+from webmd_instrument import add_instrumentation_args, get_recorder, instrumented_run
+
+TOKEN_RE = re.compile(r'[^\W_]+')
+QUERY_TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|(?:(text|condition):)?(?:"([^"]*)"|([^\s()"]+)))')
+FIELDS = ('text', 'condition')
+OPERATORS = ('AND', 'OR', 'NOT')
+
+# Curated sheets keep their own column names (stored in review_db's `extra`); the first one present is used
+SHEET_TEXT_COLUMNS = ('Review', 'Review Text', 'Text', 'text', 'Comment')
+SHEET_DATE_COLUMNS = ('Date', 'date', 'Review Date')
+SHEET_RATING_COLUMNS = ('Stars', 'Overall Rating', 'stars')
+
+def tokenize(text) -> List[str]:
+    return TOKEN_RE.findall(text.casefold()) if isinstance(text, str) else []
+
+def _offsets(counts: np.ndarray) -> np.ndarray:
+    """CSR offsets from per-term counts: term i's entries are offsets[i]:offsets[i + 1]."""
+    return np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+@dataclass
+class FieldPostings:
+    """Postings of one field: terms sorted, doc ids and occurrences grouped by term."""
+    vocab: pd.Index          # Sorted terms; a term's id is its position
+    doc_offsets: np.ndarray  # Term id -> slice of doc_ids
+    doc_ids: np.ndarray      # Sorted ids of the reviews containing each term
+    occ_offsets: np.ndarray  # Term id -> slice of occ_docs/occ_positions
+    occ_docs: np.ndarray
+    occ_positions: np.ndarray
+
+    @classmethod
+    def build(cls, texts: Iterable) -> 'FieldPostings':
+        tokens = [tokenize(text) for text in texts]
+        lengths = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+        docs = np.repeat(np.arange(len(tokens), dtype=np.int32), lengths)
+        starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        positions = (np.arange(len(docs)) - starts).astype(np.int32)
+        codes, vocab = pd.factorize(pd.Series(list(itertools.chain.from_iterable(tokens)), dtype=object), sort=True)
+
+        # Occurrences are already in doc and position order, so a stable sort by term keeps them that way
+        order = np.argsort(codes, kind='stable')
+        terms, occ_docs, occ_positions = codes[order], docs[order], positions[order]
+        first = np.ones(len(terms), dtype=bool)
+        first[1:] = (terms[1:] != terms[:-1]) | (occ_docs[1:] != occ_docs[:-1])
+        return cls(
+            vocab=pd.Index(vocab, dtype=object),
+            doc_offsets=_offsets(np.bincount(terms[first], minlength=len(vocab))),
+            doc_ids=occ_docs[first],
+            occ_offsets=_offsets(np.bincount(terms, minlength=len(vocab))),
+            occ_docs=occ_docs,
+            occ_positions=occ_positions,
+        )
+
+    def term_id(self, term: str) -> Optional[int]:
+        position = self.vocab.searchsorted(term)
+        if position < len(self.vocab) and self.vocab[position] == term:
+            return int(position)
+        return None
+
+    def docs(self, term: str) -> np.ndarray:
+        term_id = self.term_id(term)
+        if term_id is None:
+            return np.empty(0, dtype=np.int32)
+        return self.doc_ids[self.doc_offsets[term_id]:self.doc_offsets[term_id + 1]]
+
+    def prefix_docs(self, prefix: str) -> np.ndarray:
+        """Reviews containing any term starting with prefix."""
+        low, high = self.vocab.searchsorted(prefix), self.vocab.searchsorted(prefix + '\U0010ffff')
+        return np.unique(self.doc_ids[self.doc_offsets[low]:self.doc_offsets[high]])
+
+    def phrase_docs(self, terms: List[str]) -> np.ndarray:
+        """Reviews containing the terms at consecutive positions."""
+        if len(terms) == 1:
+            return self.docs(terms[0])
+        matches = None
+        for i, term in enumerate(terms):
+            term_id = self.term_id(term)
+            if term_id is None:
+                return np.empty(0, dtype=np.int32)
+            span = slice(self.occ_offsets[term_id], self.occ_offsets[term_id + 1])
+            docs, positions = self.occ_docs[span], self.occ_positions[span]
+            keep = positions >= i
+            # One key per candidate phrase start: (review, position of the phrase's first term)
+            keys = (docs[keep].astype(np.int64) << 32) | (positions[keep] - i).astype(np.int64)
+            matches = keys if matches is None else np.intersect1d(matches, keys, assume_unique=True)
+            if not len(matches):
+                break
+        return np.unique((matches >> 32).astype(np.int32))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.doc_offsets, self.doc_ids, self.occ_offsets,
+                                              self.occ_docs, self.occ_positions))
+
+class ReviewIndex:
+    """Inverted index over a review frame's text and condition columns, with filter columns."""
+    def __init__(self, reviews: pd.DataFrame, text: str = 'review_text', condition: str = 'condition',
+                 medicine: str = 'medicine', source: str = 'source', date: str = 'review_date',
+                 rating: str = 'overall_rating'):
+        self.reviews = reviews
+        with get_recorder().stage('index'):
+            self.fields = {
+                'text': FieldPostings.build(reviews[text]),
+                'condition': FieldPostings.build(reviews[condition] if condition in reviews else [None] * len(reviews)),
+            }
+            self.medicine_codes, self.medicines = pd.factorize(reviews[medicine])
+            self.source_codes, self.sources = pd.factorize(reviews[source])
+            self.dates = pd.to_datetime(reviews[date], errors='coerce').to_numpy(dtype='datetime64[D]')
+            self.ratings = pd.to_numeric(reviews[rating], errors='coerce').to_numpy(dtype=np.float32)
+        self.all_ids = np.arange(len(reviews), dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.all_ids)
+
+    def _match(self, field: Optional[str], words: List[str], prefix: bool) -> np.ndarray:
+        ids = None
+        for name in ([field] if field else FIELDS):
+            postings = self.fields[name]
+            docs = postings.prefix_docs(words[0]) if prefix else postings.phrase_docs(words)
+            ids = docs if ids is None else np.union1d(ids, docs)
+        return ids
+
+    def _parse(self, query: str) -> np.ndarray:
+        tokens: List[Tuple[str, object]] = []
+        position = 0
+        query = query.strip()
+        while position < len(query):
+            match = QUERY_TOKEN_RE.match(query, position)
+            if match is None or match.end() == position:
+                raise ValueError(f"Can't parse query at: {query[position:]!r}")
+            position = match.end()
+            opening, closing, field, phrase, word = match.groups()
+            if opening or closing:
+                tokens.append((opening or closing, None))
+            elif phrase is None and word in OPERATORS:
+                tokens.append((word, None))
+            else:
+                prefix = phrase is None and word.endswith('*')
+                words = tokenize(phrase if phrase is not None else word.rstrip('*'))
+                if not words:
+                    raise ValueError(f"Query term {match.group(0).strip()!r} has no letters or digits")
+                if prefix and len(words) > 1:
+                    raise ValueError(f"Prefix query {word!r} must be a single word")
+                tokens.append(('TERM', (field, words, prefix)))
+        tokens.append(('END', None))
+
+        def peek() -> str:
+            return tokens[0][0]
+
+        def take(kind: str):
+            if peek() != kind:
+                raise ValueError(f"Expected {kind} in query {query!r}, found {peek()}")
+            return tokens.pop(0)[1]
+
+        def or_expr() -> np.ndarray:
+            ids = and_expr()
+            while peek() == 'OR':
+                take('OR')
+                ids = np.union1d(ids, and_expr())
+            return ids
+
+        def and_expr() -> np.ndarray:
+            ids = not_expr()
+            while peek() in ('AND', 'NOT', 'TERM', '('):
+                if peek() == 'AND':
+                    take('AND')
+                ids = np.intersect1d(ids, not_expr(), assume_unique=True)
+            return ids
+
+        def not_expr() -> np.ndarray:
+            if peek() == 'NOT':
+                take('NOT')
+                return np.setdiff1d(self.all_ids, not_expr(), assume_unique=True)
+            if peek() == '(':
+                take('(')
+                ids = or_expr()
+                take(')')
+                return ids
+            return self._match(*take('TERM'))
+
+        ids = or_expr()
+        take('END')
+        return ids
+
+    def _filter(self, ids: np.ndarray, medicines: Optional[Iterable[str]], sources: Optional[Iterable[str]],
+                since: Optional[str], until: Optional[str], min_rating: Optional[float],
+                max_rating: Optional[float]) -> np.ndarray:
+        mask = np.ones(len(ids), dtype=bool)
+        for codes, categories, wanted in ((self.medicine_codes, self.medicines, medicines),
+                                          (self.source_codes, self.sources, sources)):
+            if wanted is not None:
+                wanted_codes = categories.get_indexer(list(wanted))
+                mask &= np.isin(codes[ids], wanted_codes[wanted_codes >= 0])
+        if since is not None:
+            mask &= self.dates[ids] >= np.datetime64(since, 'D')
+        if until is not None:
+            mask &= self.dates[ids] <= np.datetime64(until, 'D')
+        # Comparisons with NaN are False, so unrated reviews drop out of rating filters
+        if min_rating is not None:
+            mask &= self.ratings[ids] >= min_rating
+        if max_rating is not None:
+            mask &= self.ratings[ids] <= max_rating
+        return ids[mask]
+
+    def search(self, query: Optional[str] = None, medicines: Optional[Iterable[str]] = None,
+               sources: Optional[Iterable[str]] = None, since: Optional[str] = None, until: Optional[str] = None,
+               min_rating: Optional[float] = None, max_rating: Optional[float] = None) -> np.ndarray:
+        """Sorted row ids of the reviews matching the query (all reviews if None) and the filters."""
+        ids = self._parse(query) if query else self.all_ids
+        return self._filter(ids, medicines, sources, since, until, min_rating, max_rating)
+
+    def rows(self, ids: np.ndarray) -> pd.DataFrame:
+        return self.reviews.iloc[ids]
+
+    def count_by(self, ids: np.ndarray, column: str = 'medicine') -> pd.Series:
+        """Matching reviews per medicine or source, largest first."""
+        codes, categories = {'medicine': (self.medicine_codes, self.medicines),
+                             'source': (self.source_codes, self.sources)}[column]
+        matched = codes[ids]
+        counts = np.bincount(matched[matched >= 0], minlength=len(categories))
+        return pd.Series(counts, index=pd.Index(categories, name=column), name='reviews').sort_values(ascending=False)
+
+    def summary(self) -> str:
+        postings = sum(field.nbytes for field in self.fields.values())
+        terms = ', '.join(f"{len(field.vocab)} {name} terms" for name, field in self.fields.items())
+        return (f"Indexed {len(self)} reviews of {len(self.medicines)} medicines: {terms}, "
+                f"{postings / 1024 / 1024:.1f} MB of postings")
+
+def _first_present(record: dict, columns: Tuple[str, ...]):
+    return next((record[col] for col in columns if record.get(col) is not None), None)
+
+def load_review_corpus(db_path: str = DEFAULT_DB) -> pd.DataFrame:
+    """Every review in the SQLite store (scraped and curated sheets) with the columns ReviewIndex reads."""
+    db = sqlite3.connect(db_path)
+    df = pd.read_sql_query("""
+        SELECT rowid AS row_id, source, medicine, condition, review_date, overall_rating, review_text, extra
+        FROM reviews ORDER BY rowid
+    """, db)
+    db.close()
+
+    # Curated sheet rows keep their columns in `extra`
+    extra = df.pop('extra')
+    sheet_rows = extra.notna().to_numpy()
+    if sheet_rows.any():
+        records = [json.loads(value) for value in extra[sheet_rows]]
+        for column, candidates in (('review_text', SHEET_TEXT_COLUMNS), ('review_date', SHEET_DATE_COLUMNS),
+                                   ('overall_rating', SHEET_RATING_COLUMNS)):
+            df[column] = df[column].astype(object)
+            df.loc[sheet_rows, column] = [_first_present(record, candidates) for record in records]
+    df['review_date'] = pd.to_datetime(df['review_date'], errors='coerce', format='mixed')
+    return df
+
+def load_review_csvs(paths: List[str]) -> pd.DataFrame:
+    """Scraped review CSVs in the layout of save_to_csv, where `source` holds the medicine."""
+    df = pd.concat([pd.read_csv(path, dtype={'condition': str, 'review_text': str}) for path in paths],
+                   ignore_index=True)
+    return df.rename(columns={'source': 'medicine'}).assign(source='webmd')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('query', nargs='?', help='Query; omit to only apply the filters')
+    parser.add_argument('--db', default=DEFAULT_DB, help='SQLite review store to index (see review_db.py)')
+    parser.add_argument('--reviews', nargs='*', help='Index these scraped review CSVs instead of --db')
+    parser.add_argument('--medicine', nargs='*', help='Only these medicines')
+    parser.add_argument('--source', nargs='*', help='Only these sources (webmd, sheet:webmd, sheet:amazon, sheet:reddit)')
+    parser.add_argument('--since', help='Reviews on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--until', help='Reviews on or before this date (YYYY-MM-DD)')
+    parser.add_argument('--min-rating', type=float, help='Minimum overall rating (stars for the sheets)')
+    parser.add_argument('--max-rating', type=float, help='Maximum overall rating')
+    parser.add_argument('--count-by', choices=['medicine', 'source'], help='Print the matches per medicine or source')
+    parser.add_argument('--show', type=int, default=10, help='Matching reviews to print')
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+
+    with instrumented_run('review-index', args.report, args.profile):
+        with get_recorder().stage('load'):
+            reviews = load_review_csvs(args.reviews) if args.reviews else load_review_corpus(args.db)
+        index = ReviewIndex(reviews)
+        print(index.summary())
+
+        start = time.perf_counter()
+        ids = index.search(args.query, args.medicine, args.source, args.since, args.until,
+                           args.min_rating, args.max_rating)
+        print(f"{len(ids)} matching reviews in {(time.perf_counter() - start) * 1000:.2f} ms")
+        if args.count_by:
+            print(index.count_by(ids, args.count_by).to_string())
+        if args.show and len(ids):
+            print(index.rows(ids[:args.show])[['medicine', 'review_date', 'overall_rating', 'review_text']].to_string())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import csv
+import json
+import os
+import shutil
+from abc import ABC, abstractmethod
+from typing import Dict, List
+from urllib.parse import quote
+
+import pandas as pd
+
+import parquet_store
+from parquet_store import DEFAULT_ROOT, WEBMD_REVIEWS, normalize_reviews, review_schema
+from review_db import ReviewDB
+from review_frames import REVIEW_COLUMNS, frame_to_records, rating_value
+from webmd_instrument import get_recorder
+
+class ReviewSink(ABC):
+    """Buffers parsed reviews and writes them out in bounded batches."""
+    def __init__(self, batch_size: int = 500):
+        self.batch_size = batch_size
+        self.batch: List[dict] = []
+        self.rows_written = 0
+
+    def write(self, review: dict):
+        self.batch.append(review)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            with get_recorder().stage('write'):
+                self.write_batch(self.batch)
+            self.rows_written += len(self.batch)
+            self.batch = []
+
+    @abstractmethod
+    def write_batch(self, reviews: List[dict]):
+        """Write out one batch of parsed reviews."""
+
+    def write_frame(self, frame: pd.DataFrame):
+        """Write a typed review frame (see review_frames.py); sinks without a columnar path take it row by row."""
+        for review in frame_to_records(frame):
+            self.write(review)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Flush on errors too, so everything fetched before a crash is kept
+        self.close()
+
+class CSVSink(ReviewSink):
+    """Streams reviews to a CSV file with the same layout as save_to_csv."""
+    def __init__(self, filename: str, batch_size: int = 500):
+        super().__init__(batch_size)
+        self.filename = filename
+        self.file = None
+        self.writer = None
+
+    def write_batch(self, reviews: List[dict]):
+        if self.writer is None:
+            self.file = open(self.filename, 'w', newline='', encoding='utf-8')
+            self.writer = csv.DictWriter(self.file, fieldnames=reviews[0].keys())
+            self.writer.writeheader()
+        self.writer.writerows(reviews)
+        self.file.flush()
+
+    def write_frame(self, frame: pd.DataFrame):
+        self.flush()
+        if self.file is None:
+            self.file = open(self.filename, 'w', newline='', encoding='utf-8')
+            self.writer = csv.DictWriter(self.file, fieldnames=REVIEW_COLUMNS)
+            self.writer.writeheader()
+        with get_recorder().stage('write'):
+            # Ratings are written as the dict rows write them: 4 rather than 4.0, fractions at full precision
+            frame = frame.assign(overall_rating=frame['overall_rating'].map(rating_value))
+            frame.to_csv(self.file, header=False, index=False, lineterminator='\r\n')
+        self.file.flush()
+        self.rows_written += len(frame)
+
+    def close(self):
+        super().close()
+        if self.file is None:
+            print("No reviews to save")
+            return
+        self.file.close()
+        print(f"Successfully saved {self.rows_written} reviews to {self.filename}")
+
+class JSONLSink(ReviewSink):
+    """Streams reviews to a JSON Lines file, one review per line."""
+    def __init__(self, filename: str, batch_size: int = 500):
+        super().__init__(batch_size)
+        self.filename = filename
+        self.file = open(filename, 'w', encoding='utf-8')
+
+    def write_batch(self, reviews: List[dict]):
+        self.file.writelines(json.dumps(review) + '\n' for review in reviews)
+        self.file.flush()
+
+    def close(self):
+        super().close()
+        self.file.close()
+        print(f"Successfully saved {self.rows_written} reviews to {self.filename}")
+
+class ParquetSink(ReviewSink):
+    """Streams reviews into the typed Parquet store, one row group per batch and medicine."""
+    def __init__(self, root: str = DEFAULT_ROOT, batch_size: int = 500):
+        super().__init__(batch_size)
+        self.path = os.path.join(root, WEBMD_REVIEWS)
+        schema = review_schema()
+        # Partition values live in the directory names, not in the files
+        self.file_schema = parquet_store.pa.schema(
+            [field for field in schema if field.name not in ('source', 'medicine')])
+        self.writers: Dict[str, object] = {}
+
+    def _writer_for(self, medicine: str):
+        if medicine not in self.writers:
+            directory = os.path.join(self.path, 'source=webmd', f'medicine={quote(medicine, safe="")}')
+            # Replace the medicine's partition, as write_webmd_reviews does
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            self.writers[medicine] = parquet_store.pq.ParquetWriter(
+                os.path.join(directory, 'part-0.parquet'), self.file_schema)
+        return self.writers[medicine]
+
+    def write_batch(self, reviews: List[dict]):
+        df = normalize_reviews(pd.DataFrame(reviews))
+        for medicine, group in df.groupby('medicine', sort=False):
+            table = parquet_store.pa.Table.from_pandas(
+                group.drop(columns=['source', 'medicine']), schema=self.file_schema, preserve_index=False)
+            self._writer_for(medicine).write_table(table)
+
+    def write_frame(self, frame: pd.DataFrame):
+        self.flush()
+        with get_recorder().stage('write'):
+            for medicine, group in frame.groupby('source', observed=True, sort=False):
+                # Dates that don't parse are stored as nulls, as normalize_reviews stores them
+                group = group.assign(review_date=pd.to_datetime(group['review_date'].astype(object), format='%Y-%m-%d',
+                                                                errors='coerce'))
+                # The other dtypes already match the schema up to widths, so arrow only casts them
+                table = parquet_store.pa.Table.from_pandas(group.drop(columns=['source']), preserve_index=False)
+                self._writer_for(medicine).write_table(table.select(self.file_schema.names).cast(self.file_schema))
+        self.rows_written += len(frame)
+
+    def close(self):
+        super().close()
+        for writer in self.writers.values():
+            writer.close()
+        print(f"Stored {self.rows_written} reviews in {self.path}")
+
+class SQLiteSink(ReviewSink):
+    """Upserts reviews into the SQLite review store, one transaction per batch."""
+    def __init__(self, db: ReviewDB, batch_size: int = 500):
+        super().__init__(batch_size)
+        self.db = db
+
+    def write_batch(self, reviews: List[dict]):
+        self.db.upsert_reviews(reviews)
+
+    def close(self):
+        super().close()
+        self.db.close()
+        print(f"Upserted {self.rows_written} reviews into {self.db.path}")
+
+class FanOutSink(ReviewSink):
+    """Sends every review to several sinks."""
+    def __init__(self, sinks: List[ReviewSink]):
+        super().__init__(batch_size=1)
+        self.sinks = sinks
+
+    def write(self, review: dict):
+        for sink in self.sinks:
+            sink.write(review)
+        self.rows_written += 1
+
+    def write_batch(self, reviews: List[dict]):
+        for sink in self.sinks:
+            for review in reviews:
+                sink.write(review)
+
+    def write_frame(self, frame: pd.DataFrame):
+        for sink in self.sinks:
+            sink.write_frame(frame)
+        self.rows_written += len(frame)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+def open_sink(path: str, batch_size: int = 500) -> ReviewSink:
+    """Pick a sink from the output path: .csv, .jsonl, or otherwise a Parquet dataset directory."""
+    if path.endswith('.csv'):
+        return CSVSink(path, batch_size)
+    if path.endswith('.jsonl'):
+        return JSONLSink(path, batch_size)
+    return ParquetSink(path, batch_size)
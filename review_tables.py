@@ -0,0 +1,243 @@
+"""Weighted yes/no/no-information tables of the curated kidney stone review sheets.
+
+This is the table logic of chanca-piedra-analysis.ipynb (get_chanca_piedra_weights,
+calculate_weighted_stats and create_table). The weights are computed once per sheet, and
+the percentages of every site, filter case, medicine and column come out of one grouped
+aggregation over a matrix of filter masks, instead of one refiltered groupby per table.
+
+Usage:
+    python review_tables.py                  # regenerate every docs/*-table-full-analysis*.html
+    python review_tables.py --sites WebMD --output-dir /tmp/tables
+"""
+import argparse
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from parquet_store import DEFAULT_ROOT, KIDNEY_STONE_REVIEWS, load_kidney_stone_reviews
+from webmd_instrument import add_instrumentation_args, get_recorder, instrumented_run
+
+COLUMNS_TO_ANALYZE = [
+    'Helps overall with kidney stones',
+    'Side effects mentioned',
+    'Works as a prophylactic',
+    'Asserts significant pain reduction',
+    'Mentions breaking of stones',
+    'Mentions shrinking of the stones',
+    'Mentions softening of stones',
+    'Mentions stone gravel/dust/dissolved',
+    'Stone passed with no or almost no pain',
+    'Helps overall with gallstones',
+]
+
+# Filter case -> suffix of its table file; every case but 'All Reviews' keeps the rows where its column is 1
+TABLE_CASES = {
+    'All Reviews': "",
+    'Super high quality': "-high-quality",
+    'Says that has suffered from condition for a long time (>1 year)': "-long-time",
+    'Someone who makes large amounts of stones (>10 total)': "-stoner"
+}
+ALL_REVIEWS = 'All Reviews'
+TABLE_FILTERS = {case: {} if case == ALL_REVIEWS else {case: 1} for case in TABLE_CASES}
+
+# Star counts of the scraped Amazon reviews vs. the counts Amazon shows, per Chanca piedra brand
+CHANCA_PIEDRA_CORRECTIONS = {
+    "NaturalisimoLife Chanca Piedra 1600 mg": {
+        "scraped": [82, 18, 37, 103, 146],  # 1-5 stars
+        "actual": [82, 18, 38, 103, 906]
+    },
+    "EU Natural: \"Stone Breaker\" chanca piedra": {
+        "scraped": [102, 44, 50, 100, 138],  # 1-5 stars
+        "actual": [123, 44, 50, 131, 918]
+    }
+}
+WEIGHTED_MEDICINE = 'Chanca piedra'
+
+@dataclass
+class SiteTables:
+    """How one site's tables are built and named."""
+    prefix: str
+    medicines_to_exclude: List[str] = field(default_factory=list)
+    medicine_mapping: Dict[str, str] = field(default_factory=dict)
+    weighted: bool = False  # Reweight Chanca piedra reviews with CHANCA_PIEDRA_CORRECTIONS
+
+WEBMD_MEDICINE_MAPPING = {
+    'Hydrochlorothiazide': 'HCTZ',
+    'Potassium Citrate': 'Potassium citrate'
+}
+WEBMD_MEDICINES_TO_EXCLUDE = ['Ashwagandha', 'Melatonin']
+
+SITE_TABLES = {
+    'WebMD': SiteTables('webmd', WEBMD_MEDICINES_TO_EXCLUDE, WEBMD_MEDICINE_MAPPING),
+    # The published Amazon tables were built with the WebMD exclusions and mapping
+    'Amazon': SiteTables('amazon', WEBMD_MEDICINES_TO_EXCLUDE, WEBMD_MEDICINE_MAPPING, weighted=True),
+    'Reddit': SiteTables('reddit', [], {'Hydrochlorothiazide': 'HCTZ'}),
+}
+
+def chanca_piedra_weights(df: pd.DataFrame) -> np.ndarray:
+    """Weight of each review: actual / scraped count of its brand and star rating for Chanca piedra, else 1."""
+    brands = list(CHANCA_PIEDRA_CORRECTIONS)
+    # lookup[brand, stars]; column 0 and ratings without a correction keep weight 1
+    lookup = np.ones((len(brands), 6))
+    for b, data in enumerate(CHANCA_PIEDRA_CORRECTIONS.values()):
+        for i, (scraped, actual) in enumerate(zip(data['scraped'], data['actual'])):
+            if scraped > 0:  # Avoid division by zero
+                lookup[b, i + 1] = actual / scraped
+
+    brand = pd.Categorical(df['Source'], categories=brands).codes
+    corrected = ((df['Medicine'] == WEIGHTED_MEDICINE).to_numpy() & (brand >= 0)
+                 & df['Stars'].isin(range(1, 6)).to_numpy())
+    weights = np.ones(len(df))
+    weights[corrected] = lookup[brand[corrected], df['Stars'].to_numpy()[corrected].astype(int)]
+    return weights
+
+def yes_no_answers(column: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Positive (1 or any non-blank text) and negative (0) answers of an annotation column."""
+    if pd.api.types.is_numeric_dtype(column):
+        return column.eq(1).to_numpy(), column.eq(0).to_numpy()
+    values = column.astype(object)
+    text = values.map(lambda value: isinstance(value, str) and bool(value.strip()))
+    return (values.eq(1) | text).to_numpy(), values.eq(0).to_numpy()
+
+def case_masks(df: pd.DataFrame, cases: Dict[str, dict]) -> np.ndarray:
+    """Boolean matrix (reviews x cases) of the rows each case's {column: value} filters keep."""
+    masks = np.ones((len(df), len(cases)), dtype=bool)
+    for c, filters in enumerate(cases.values()):
+        for column, value in filters.items():
+            masks[:, c] &= df[column].eq(value).to_numpy()
+    return masks
+
+def weighted_percentages(sheets: Dict[str, pd.DataFrame], columns: List[str] = COLUMNS_TO_ANALYZE,
+                         cases: Dict[str, dict] = TABLE_FILTERS,
+                         weighted_sites: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Weighted yes/no/no-information percentages for every (site, case, medicine, column) in one aggregation.
+
+    `cases` maps each case to its {column: value} filters. Chanca piedra reviews are
+    reweighted on weighted_sites (default: the sites configured as weighted). Returns one
+    tidy row per combination, including medicines without reviews in a case (all zeros),
+    with the review count and weighted count of the (site, case, medicine).
+    """
+    if weighted_sites is None:
+        weighted_sites = [site for site, config in SITE_TABLES.items() if config.weighted]
+    groups, masks, values = [], [], []
+    for site, df in sheets.items():
+        weights = chanca_piedra_weights(df) if site in weighted_sites else np.ones(len(df))
+        answers = [yes_no_answers(df[col]) for col in columns]
+        # One row per review: count, weight, then the weighted yes and no answers of each column
+        values.append(np.column_stack([np.ones(len(df)), weights]
+                                      + [answer * weights for pair in answers for answer in pair]))
+        masks.append(case_masks(df, cases))
+        groups.append(pd.DataFrame({'site': site, 'Medicine': df['Medicine'].to_numpy()}))
+
+    groups = pd.concat(groups, ignore_index=True)
+    group_index = pd.MultiIndex.from_frame(groups).drop_duplicates().sort_values()
+    codes = group_index.get_indexer(pd.MultiIndex.from_frame(groups))
+    values = np.vstack(values)
+    masks = np.vstack(masks)
+
+    # sums[case, group, k] = sum of values[:, k] over the reviews of the group that the case keeps
+    one_hot = np.zeros((len(codes), len(group_index)))
+    one_hot[np.arange(len(codes)), codes] = 1
+    keep = (masks[:, :, None] * one_hot[:, None, :]).reshape(len(codes), -1)
+    sums = (keep.T @ values).reshape(len(cases), len(group_index), values.shape[1])
+
+    total, weighted_total = sums[..., 0], sums[..., 1]
+    positive, negative = sums[..., 2::2], sums[..., 3::2]
+    # Only Chanca piedra is reweighted, so its percentages are of the weighted count
+    is_weighted = (group_index.get_level_values('Medicine') == WEIGHTED_MEDICINE)[None, :]
+    denominator = np.where(is_weighted, weighted_total, total)[..., None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percentages = {name: np.nan_to_num(part / denominator * 100).round(1) for name, part in (
+            ('positive_pct', positive), ('negative_pct', negative),
+            ('no_info_pct', denominator - positive - negative))}
+
+    case_codes, group_codes, column_codes = np.indices(positive.shape).reshape(3, -1)
+    return pd.DataFrame({
+        'site': group_index.get_level_values('site')[group_codes],
+        'case': np.asarray(list(cases))[case_codes],
+        'Medicine': group_index.get_level_values('Medicine')[group_codes],
+        'column': np.asarray(columns)[column_codes],
+        'total_reviews': total[case_codes, group_codes].astype(int),
+        'total_reviews_weighted': weighted_total[case_codes, group_codes],
+        **{name: pct.reshape(-1) for name, pct in percentages.items()},
+    })
+
+def display_table(stats: pd.DataFrame, site: str, case: str, columns: List[str] = COLUMNS_TO_ANALYZE,
+                  medicines_to_exclude: Optional[List[str]] = None,
+                  medicine_mapping: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """Lay out one (site, case) of weighted_percentages as the notebook's transposed table."""
+    config = SITE_TABLES.get(site, SiteTables(site.lower()))
+    exclude = config.medicines_to_exclude if medicines_to_exclude is None else medicines_to_exclude
+    mapping = config.medicine_mapping if medicine_mapping is None else medicine_mapping
+
+    rows = stats[(stats['site'] == site) & (stats['case'] == case) & ~stats['Medicine'].isin(exclude)]
+    transposed_data = {' ': ['<b>Total Reviews</b>'] + sum([[f'<b>{col}</b>', '    Yes', '    No', '    No information']
+                                                           for col in columns], [])}
+    for medicine, table in rows.groupby('Medicine', sort=True):
+        table = table.set_index('column').loc[columns]
+        transposed_data[mapping.get(medicine, medicine)] = [int(table['total_reviews'].iloc[0])] + sum([[
+            '',
+            float(table.at[col, 'positive_pct']),
+            float(table.at[col, 'negative_pct']),
+            float(table.at[col, 'no_info_pct'])
+        ] for col in columns], [])
+    return pd.DataFrame(transposed_data).set_index(' ')
+
+def create_table(dfa: pd.DataFrame, columns_to_analyze: List[str], medicines_to_exclude: List[str],
+                 medicine_mapping: Dict[str, str], filters: Optional[dict] = None,
+                 high_quality_reviews_only: bool = False, is_amazon_data: bool = False) -> pd.DataFrame:
+    """The notebook's create_table: one table for one filter, computed with weighted_percentages."""
+    if filters is None:
+        filters = {'Super high quality': 1} if high_quality_reviews_only else {}
+    stats = weighted_percentages({'table': dfa}, columns_to_analyze, {'table': filters},
+                                 weighted_sites=['table'] if is_amazon_data else [])
+    return display_table(stats, 'table', 'table', columns_to_analyze, medicines_to_exclude, medicine_mapping)
+
+TABLE_COLUMNS = list(dict.fromkeys(['Medicine', 'Source', 'Stars'] + COLUMNS_TO_ANALYZE
+                                   + [case for case in TABLE_CASES if case != ALL_REVIEWS]))
+
+def sheet_csv_path(site: str, csv_dir: str = 'csv-files') -> str:
+    return os.path.join(csv_dir, f'Kidney Stone Reviews - Reviews - {site}.csv')
+
+def load_sheet(site: str, root: str = DEFAULT_ROOT, csv_dir: str = 'csv-files',
+               columns: List[str] = TABLE_COLUMNS) -> pd.DataFrame:
+    """Load the columns the tables use from the typed Parquet store (see parquet_store.py), else the CSV sheet."""
+    if Path(root, KIDNEY_STONE_REVIEWS).exists():
+        return load_kidney_stone_reviews(site, root, columns=columns)
+    return pd.read_csv(sheet_csv_path(site, csv_dir), usecols=lambda col: col in columns)
+
+def write_tables(sheets: Dict[str, pd.DataFrame], output_dir: str = 'docs/') -> List[str]:
+    """Write every site's table for every filter case as <prefix>-table-full-analysis<suffix>.html."""
+    recorder = get_recorder()
+    with recorder.stage('aggregate'):
+        stats = weighted_percentages(sheets)
+    paths = []
+    with recorder.stage('write'):
+        for site in sheets:
+            for case, suffix in TABLE_CASES.items():
+                path = os.path.join(output_dir, f"{SITE_TABLES[site].prefix}-table-full-analysis{suffix}.html")
+                display_table(stats, site, case).to_html(path)
+                paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sites', nargs='+', default=list(SITE_TABLES), choices=list(SITE_TABLES))
+    parser.add_argument('--root', default=DEFAULT_ROOT, help='Parquet dataset directory, used when it has been built')
+    parser.add_argument('--csv-dir', default='csv-files', help='Directory with the "Kidney Stone Reviews - Reviews - *.csv" sheets')
+    parser.add_argument('--output-dir', default='docs/', help='Where to write the HTML tables')
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+
+    with instrumented_run('review-tables', args.report, args.profile) as recorder:
+        with recorder.stage('load'):
+            sheets = {site: load_sheet(site, args.root, args.csv_dir) for site in args.sites}
+        paths = write_tables(sheets, args.output_dir)
+        print(f"Wrote {len(paths)} tables to {args.output_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,126 @@
+import argparse
+import os
+from typing import Iterable
 import pandas as pd
 import numpy as np
 
-def analyze_supplement_ratings(csv_file: str, target_supplement: str = 'chanca piedra'):
-    # Read the CSV file
-    df = pd.read_csv(csv_file)
+from review_db import ReviewDB
+from webmd_instrument import add_instrumentation_args, get_recorder, instrumented_run
+
+RATINGS_COLUMNS = ['name', 'rating', 'num_reviews']
+DEFAULT_THRESHOLDS = [10, 50, 100]
+
+def load_ratings(path: str) -> pd.DataFrame:
+    """Load only the columns the analysis needs, from the SQLite or Parquet store or the ratings CSV."""
+    if path.endswith(('.sqlite', '.db')):
+        db = ReviewDB(path)
+        df = db.latest_ratings()[RATINGS_COLUMNS]
+        db.close()
+        return df.astype({'rating': 'float64', 'num_reviews': 'float64'})
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path, columns=RATINGS_COLUMNS)
+        # The analysis works on plain floats with NaN for missing values
+        return df.astype({'rating': 'float64', 'num_reviews': 'float64'})
     
+    df = pd.read_csv(path, usecols=RATINGS_COLUMNS)
     # Convert rating and num_reviews to numeric, replacing empty values with NaN
     df['rating'] = pd.to_numeric(df['rating'], errors='coerce')
     df['num_reviews'] = pd.to_numeric(df['num_reviews'], errors='coerce')
+    return df
+
+def rank_supplements(df: pd.DataFrame, thresholds: Iterable[int] = DEFAULT_THRESHOLDS) -> pd.DataFrame:
+    """Rank every supplement among those with at least `threshold` reviews, for every threshold at once.
+
+    Returns one tidy row per (threshold, qualifying supplement) with its rank (1 + number of
+    qualifying supplements rated higher), percentile, z-score and position in the top list,
+    plus the threshold's summary statistics, ordered by threshold and then by rating.
+    """
+    thresholds = np.unique(np.asarray(list(thresholds), dtype='float64'))
+    ratings = df['rating'].to_numpy(dtype='float64')
+    num_reviews = df['num_reviews'].to_numpy(dtype='float64')
+    rated = ~np.isnan(ratings)
     
-    # Function to calculate percentile for a given minimum number of reviews
-    def get_percentile(min_reviews: int) -> float:
-        # Filter supplements with minimum number of reviews
-        filtered_df = df[df['num_reviews'] >= min_reviews]
-        
-        # Find target supplement's rating
-        target_rating = filtered_df[filtered_df['name'].str.lower() == target_supplement.lower()]['rating'].iloc[0]
-        
-        # Calculate percentile and rank
-        total_count = len(filtered_df)
-        rank = (filtered_df['rating'] > target_rating).sum() + 1
-        percentile = ((total_count - rank + 1) / total_count) * 100
-        
-        # Calculate statistics
-        mean_rating = filtered_df['rating'].mean()
-        median_rating = filtered_df['rating'].median()
-        std_rating = filtered_df['rating'].std()
-        z_score = (target_rating - mean_rating) / std_rating
-        
-        return {
-            'total_supplements': total_count,
-            'target_rating': target_rating,
-            'percentile': percentile,
-            'rank': rank,
-            'mean_rating': mean_rating,
-            'median_rating': median_rating,
-            'std_rating': std_rating,
-            'z_score': z_score
-        }
+    # Qualifying sets are nested (every supplement with 100+ reviews also has 10+), so each supplement
+    # is counted once at the highest threshold it reaches and a reverse cumulative sum fills in the rest
+    reached = np.searchsorted(thresholds, np.nan_to_num(num_reviews, nan=-np.inf), side='right') - 1
+    values, codes = np.unique(ratings[rated], return_inverse=True)
+    if not len(values):
+        # Nothing is rated (e.g. every fetch failed): a NaN placeholder keeps the histograms one column
+        # wide, so the statistics come out NaN and no supplement gets a rank
+        values = np.array([np.nan])
+    entries = np.zeros((len(thresholds), len(values)), dtype='int64')
+    counted = reached[rated] >= 0
+    np.add.at(entries, (reached[rated][counted], codes[counted]), 1)
+    histogram = entries[::-1].cumsum(axis=0)[::-1]  # histogram[t, v]: supplements rated values[v] at threshold t
+    qualifying = np.bincount(reached[reached >= 0], minlength=len(thresholds))[::-1].cumsum()[::-1]
     
-    # Analyze for different minimum review thresholds
-    thresholds = [10, 50, 100]
-    results = {}
+    # Per-threshold statistics of the rated supplements, all read off the histograms
+    count = histogram.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = histogram @ values / count
+        std = np.sqrt((histogram * (values[None, :] - mean[:, None]) ** 2).sum(axis=1) / (count - 1))
+    cumulative = histogram.cumsum(axis=1)
+    lower = values[(cumulative > ((count - 1) // 2)[:, None]).argmax(axis=1)]
+    upper = values[(cumulative > (count // 2)[:, None]).argmax(axis=1)]
+    median = np.where(count > 0, (lower + upper) / 2, np.nan)
+    higher = cumulative[:, -1:] - cumulative  # higher[t, v]: supplements rated above values[v]
+    
+    # One sort by rating (ties keep their listing order, unrated last) serves every threshold
+    order = np.lexsort((np.arange(len(df)), -ratings))
+    threshold_idx, row = np.nonzero(num_reviews[order][None, :] >= thresholds[:, None])
+    row = order[row]
+    
+    rating_code = np.full(len(df), -1)
+    rating_code[rated] = codes
+    row_rated = rated[row]
+    rank = np.where(row_rated, higher[threshold_idx, rating_code[row]] + 1, np.nan)
+    total = qualifying[threshold_idx]
     
+    # Position among the threshold's rated supplements, i.e. the top-N order
+    rated_so_far = np.cumsum(row_rated)
+    group_start = np.searchsorted(threshold_idx, threshold_idx)
+    position = rated_so_far - rated_so_far[group_start] + row_rated[group_start]
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z_score = (ratings[row] - mean[threshold_idx]) / std[threshold_idx]
+    table = pd.DataFrame({
+        'threshold': thresholds[threshold_idx].astype('int64'),
+        'name': df['name'].to_numpy()[row],
+        'rating': ratings[row],
+        'num_reviews': num_reviews[row].astype('int64'),
+        'rank': pd.array(np.where(row_rated, rank, 0), dtype='Int64'),
+        'percentile': (total - rank + 1) / total * 100,
+        'z_score': z_score,
+        'position': pd.array(position, dtype='Int64'),
+        'total_supplements': total,
+        'mean_rating': mean[threshold_idx],
+        'median_rating': median[threshold_idx],
+        'std_rating': std[threshold_idx],
+    }, index=df.index[row])
+    # Unrated supplements have no rank or top-list position
+    table.loc[~row_rated, ['rank', 'position']] = pd.NA
+    return table
+
+def analyze_supplement_ratings(ratings_file: str, target_supplement: str = 'chanca piedra',
+                               thresholds: Iterable[int] = DEFAULT_THRESHOLDS, top_n: int = 10) -> pd.DataFrame:
+    recorder = get_recorder()
+    with recorder.stage('load'):
+        df = load_ratings(ratings_file)
+    thresholds = sorted(set(thresholds))
+    with recorder.stage('rank'):
+        table = rank_supplements(df, thresholds)
+    
+    # Analyze the target for the different minimum review thresholds, taking its first listing if repeated
+    target_rows = table[table['name'].str.lower() == target_supplement.lower()]
+    target_rows = target_rows.sort_index(kind='stable').drop_duplicates('threshold')
+    results = {}
     for threshold in thresholds:
-        try:
-            results[threshold] = get_percentile(threshold)
-        except Exception as e:
-            print(f"Could not calculate percentile for {threshold} minimum reviews: {str(e)}")
+        result = target_rows[target_rows['threshold'] == threshold]
+        if len(result) == 0:
+            print(f"Could not calculate percentile for {threshold} minimum reviews: "
+                  f"{target_supplement} has fewer reviews or is not listed")
+            continue
+        results[threshold] = result.iloc[0]
     
     # Print overall statistics
     print("\nOverall Statistics:")
@@ -59,7 +132,7 @@ def analyze_supplement_ratings(csv_file: str, target_supplement: str = 'chanca p
     for threshold, result in results.items():
         print(f"\nFor supplements with {threshold}+ reviews:")
         print(f"Number of qualifying supplements: {result['total_supplements']}")
-        print(f"Chanca Piedra rating: {result['target_rating']:.1f}")
+        print(f"Chanca Piedra rating: {result['rating']:.1f}")
         print(f"Average rating: {result['mean_rating']:.2f}")
         print(f"Median rating: {result['median_rating']:.2f}")
         print(f"Standard deviation: {result['std_rating']:.2f}")
@@ -68,16 +141,32 @@ def analyze_supplement_ratings(csv_file: str, target_supplement: str = 'chanca p
     
     # Print top supplements for each threshold
     for threshold in thresholds:
-        filtered_df = df[df['num_reviews'] >= threshold].copy()
-        # Convert num_reviews to integer type for display
-        filtered_df['num_reviews'] = filtered_df['num_reviews'].astype(int)
-        top_supplements = filtered_df.nlargest(10, 'rating')
-        print(f"\nTop 10 highest rated supplements (min {threshold} reviews):")
+        top_supplements = table[(table['threshold'] == threshold) & (table['position'] <= top_n)]
+        print(f"\nTop {top_n} highest rated supplements (min {threshold} reviews):")
         if len(top_supplements) > 0:
-            # Reset index and drop it to remove the numerical IDs
-            print(top_supplements[['name', 'rating', 'num_reviews']].reset_index(drop=True).to_string(index=False))
+            print(top_supplements[['name', 'rating', 'num_reviews']].to_string(index=False))
         else:
             print("No supplements found with this many reviews.")
+    
+    return table
 
 if __name__ == "__main__":
-    analyze_supplement_ratings('webmd_supplement_ratings.csv')
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Rank supplements by WebMD rating at several minimum review counts')
+    parser.add_argument('--ratings', help='Ratings CSV, Parquet file or SQLite review store '
+                        '(default: the Parquet store if built, else webmd_supplement_ratings.csv)')
+    parser.add_argument('--target', default='chanca piedra', help='Supplement to report on')
+    parser.add_argument('--thresholds', type=int, nargs='+', default=DEFAULT_THRESHOLDS, help='Minimum review counts')
+    parser.add_argument('--top', type=int, default=10, help='Size of the top lists')
+    parser.add_argument('--table', help='Write the full ranking table (all supplements, all thresholds) to this CSV')
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+    
+    # Prefer the typed Parquet store (see parquet_store.py) when it has been built
+    parquet_file = os.path.join('dataset', 'supplement_ratings.parquet')
+    ratings_file = args.ratings or (parquet_file if os.path.exists(parquet_file) else 'webmd_supplement_ratings.csv')
+    with instrumented_run('webmd-analysis', args.report, args.profile) as recorder:
+        table = analyze_supplement_ratings(ratings_file, args.target, args.thresholds, args.top)
+        if args.table:
+            with recorder.stage('write'):
+                table.to_csv(args.table, index=False)
+            print(f"\nSaved {len(table)} rankings to {args.table}")
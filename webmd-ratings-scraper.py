@@ -1,15 +1,35 @@
-import requests
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from bs4 import BeautifulSoup
 import pandas as pd
-import time
 import re
-from typing import Dict, Optional, Tuple
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from parquet_store import write_supplement_ratings
+from review_db import ReviewDB
+from webmd_extract import extract_aggregate_rating
+from webmd_http import WebMDClient, get_default_client
+from webmd_instrument import add_instrumentation_args, get_recorder, instrumented_run
+
+SUPPLEMENT_MONOGRAPH_RE = re.compile(r'ingredientmono-(\d+)/([^/]+)$')
+# Journal and output status of a supplement: its review page loaded (rated or not), or the fetch failed
+STATUS_OK = 'ok'
+STATUS_FAILED = 'failed'
+
+def review_url_for(main_url: str) -> Optional[str]:
+    """Review page URL of a supplement monograph URL, or None if the URL is not a monograph."""
+    match = SUPPLEMENT_MONOGRAPH_RE.search(main_url)
+    if match:
+        supplement_id, supplement_name = match.groups()
+        return f"https://reviews.webmd.com/vitamins-supplements/ingredientreview-{supplement_id}-{supplement_name.upper()}"
+    return None
 
 class WebMDSupplementRatingsScraper:
-    def __init__(self):
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
+    def __init__(self, client: Optional[WebMDClient] = None, max_workers: int = 8):
+        self.client = client or get_default_client()
+        self.max_workers = max_workers
         
     def clean_url(self, url: str) -> str:
         """Clean malformed URLs that might have duplicate domains"""
@@ -21,15 +41,10 @@ class WebMDSupplementRatingsScraper:
     def get_review_url(self, main_url: str) -> str:
         """Construct the review URL from the main URL format"""
         try:
-            # Extract the supplement ID and name from the main URL
-            match = re.search(r'ingredientmono-(\d+)/([^/]+)$', main_url)
-            if match:
-                supplement_id = match.group(1)
-                supplement_name = match.group(2)
-                review_url = f"https://reviews.webmd.com/vitamins-supplements/ingredientreview-{supplement_id}-{supplement_name.upper()}"
+            review_url = review_url_for(main_url)
+            if review_url:
                 print(f"Constructed review URL: {review_url}")
-                return review_url
-            return None
+            return review_url
         except Exception as e:
             print(f"Error constructing review URL: {str(e)}")
             return None
@@ -44,15 +59,73 @@ class WebMDSupplementRatingsScraper:
             if not review_url:
                 print("Could not construct review URL")
                 return None, None
-                
-            print(f"Fetching reviews from: {review_url}")
             
-            response = requests.get(review_url, headers=self.headers)
-            if not response.ok:
-                print(f"Failed to get review page: {response.status_code}")
-                return None, None
-                
-            soup = BeautifulSoup(response.text, 'html.parser')
+            return self.get_ratings_from_review_page(review_url)
+            
+        except Exception as e:
+            print(f"Error processing review page: {str(e)}")
+            return None, None
+
+    def fetch_review_page_ratings(self, review_url: str) -> Tuple[Optional[float], Optional[int]]:
+        """Fetch a review page and extract its rating and number of reviews; raises when the fetch fails.
+
+        A page that loads but has no rating (most supplements have no reviews) returns (None, None).
+        """
+        print(f"Fetching reviews from: {review_url}")
+        recorder = get_recorder()
+        
+        with recorder.stage('fetch', review_url):
+            response = self.client.get(review_url)
+        if not response.ok:
+            recorder.count('page_errors')
+            print(f"Failed to get review page: {response.status_code}")
+            response.raise_for_status()
+        
+        with recorder.stage('extract', review_url):
+            rating, count = extract_aggregate_rating(response.text)
+            if rating is None:
+                rating, count = self.extract_ratings(response.text)
+        if rating is None:
+            recorder.count('empty_pages')
+        return rating, count
+
+    def get_ratings_from_review_page(self, review_url: str) -> Tuple[Optional[float], Optional[int]]:
+        """Fetch a review page (as built by get_review_url) and extract its overall rating and number of reviews"""
+        try:
+            return self.fetch_review_page_ratings(review_url)
+        except Exception as e:
+            print(f"Error processing review page: {str(e)}")
+            return None, None
+
+    def get_ratings_with_status(self, review_url: str) -> Tuple[Optional[float], Optional[int], str]:
+        """Like get_ratings_from_review_page, plus 'ok' when the page loaded (rated or not) or 'failed'."""
+        try:
+            return (*self.fetch_review_page_ratings(review_url), STATUS_OK)
+        except Exception as e:
+            print(f"Error processing review page: {str(e)}")
+            return None, None, STATUS_FAILED
+
+    def iter_ratings(self, review_urls: Iterable[str]) -> Iterator[Tuple[str, Optional[float], Optional[int], str]]:
+        """Fetch review pages concurrently, yielding (review_url, rating, num_reviews, status) as each one finishes.
+
+        The client's rate limiter sets the request budget; max_workers only bounds the requests in flight.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='webmd-fetch') as executor:
+            futures = {executor.submit(self.get_ratings_with_status, url): url for url in dict.fromkeys(review_urls)}
+            for future in as_completed(futures):
+                yield (futures[future], *future.result())
+
+    def get_ratings_batch(self, review_urls: Iterable[str]) -> pd.DataFrame:
+        """Batch API: ratings for many review URLs, as a review_url/rating/num_reviews/status table."""
+        df = pd.DataFrame(list(self.iter_ratings(review_urls)), columns=['review_url', 'rating', 'num_reviews', 'status'])
+        df['rating'] = pd.to_numeric(df['rating'])
+        df['num_reviews'] = pd.to_numeric(df['num_reviews']).astype('Int64')
+        return df
+
+    def extract_ratings(self, html: str) -> Tuple[Optional[float], Optional[int]]:
+        """Find the overall rating and number of reviews in a review page's HTML"""
+        try:
+            soup = BeautifulSoup(html, 'html.parser')
             
             # Look for rating in the overall experience rating section
             try:
@@ -92,48 +165,163 @@ class WebMDSupplementRatingsScraper:
             print(f"Error processing review page: {str(e)}")
             return None, None
 
-    def scrape_all_ratings(self, input_csv: str) -> pd.DataFrame:
-        """Scrape ratings for all supplements from the input CSV containing URLs"""
-        # Read supplement URLs
+    def scrape_all_ratings(self, input_csv: str, output_csv: str = 'webmd_supplement_ratings.csv',
+                           journal_path: str = 'webmd_supplement_ratings.journal.jsonl',
+                           resume: bool = False, carry_over: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """Scrape ratings for all supplements from the input CSV containing URLs
+
+        Supplements in carry_over (url, rating, num_reviews, status) keep those ratings and are not fetched
+        again. The output has a status column: 'ok' when the review page loaded, whether or not it had a
+        rating, and 'failed' when it could not be fetched.
+        """
+        # Read supplement URLs and clean them up front
         df = pd.read_csv(input_csv)
+        df['url'] = df['url'].map(self.clean_url)
+        if carry_over is not None:
+            carry_over = carry_over.assign(status=fetch_status(carry_over))
+            df = df.drop(columns=['rating', 'num_reviews', 'status'], errors='ignore').merge(
+                carry_over[['url', 'rating', 'num_reviews', 'status']].drop_duplicates('url'), on='url', how='left')
+        
+        journal = RatingsJournal(journal_path)
+        if resume:
+            completed = journal.completed()
+            # Rows already fetched (e.g. a previous output CSV used as input) are done too
+            if 'rating' in df.columns:
+                completed.update({url: {} for url in df.loc[fetch_status(df) == STATUS_OK, 'url']})
+            print(f"Resuming: {len(completed)} supplements already completed")
+        else:
+            journal.reset()
+            completed = {}
+        if carry_over is not None:
+            carried = df.loc[df['status'] == STATUS_OK, 'url']
+            completed.update({url: {} for url in carried})
+            print(f"Keeping the previous ratings of {len(carried)} unchanged supplements")
+        
+        # Fetch every supplement not yet in the journal concurrently, journaling each as it finishes
+        pending = df[~df['url'].isin(completed)]
+        review_urls = pending['url'].map(self.get_review_url)
+        urls_by_review_url: Dict[str, list] = {}
+        for url, review_url in zip(pending['url'], review_urls):
+            if review_url:
+                urls_by_review_url.setdefault(review_url, []).append(url)
+            else:
+                print(f"Could not construct review URL for {url}")
+                journal.append({'url': url, 'rating': None, 'num_reviews': None, 'status': STATUS_FAILED})
+        
+        for position, (review_url, rating, num_reviews, status) in enumerate(self.iter_ratings(urls_by_review_url), 1):
+            print(f"[{position}/{len(urls_by_review_url)}] {review_url}: rating {rating}, num_reviews {num_reviews}")
+            with get_recorder().stage('write', review_url):
+                for url in urls_by_review_url[review_url]:
+                    journal.append({'url': url, 'rating': rating, 'num_reviews': num_reviews, 'status': status})
+        
+        # Compact the journal into the final CSV once
+        with get_recorder().stage('write'):
+            df = journal.compact(df)
+            df.to_csv(output_csv, index=False)
+        print(f"Saved {df['rating'].notna().sum()} ratings for {len(df)} supplements to {output_csv}")
+        failed = (df['status'] == STATUS_FAILED).sum()
+        if failed:
+            print(f"{failed} supplements could not be fetched; rerun with --resume to retry them")
+        
+        return df
+
+def record_status(record: dict) -> Optional[str]:
+    """Status of a journal record; records written before the status field count as fetched when rated."""
+    if record.get('status'):
+        return record['status']
+    return STATUS_OK if record.get('rating') is not None else None
+
+def fetch_status(df: pd.DataFrame) -> pd.Series:
+    """Status column of a ratings table, filled in for tables written before it had one."""
+    status = df['status'] if 'status' in df.columns else pd.Series(None, index=df.index, dtype=object)
+    return status.where(status.notna(), df['rating'].notna().map({True: STATUS_OK, False: None}))
+
+class RatingsJournal:
+    """Append-only JSON Lines checkpoint with one record per completed supplement."""
+    def __init__(self, path: str):
+        self.path = path
+
+    def reset(self):
+        """Start a fresh journal, discarding any previous run."""
+        open(self.path, 'w', encoding='utf-8').close()
+
+    def load(self) -> Dict[str, dict]:
+        """Return completed records keyed by URL; later records win."""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn final line from a crash mid-write
+                records[record['url']] = record
+        return records
+
+    def completed(self) -> Dict[str, dict]:
+        """Records of supplements whose review page was fetched, rated or not; failed fetches are retried on resume."""
+        return {url: record for url, record in self.load().items() if record_status(record) == STATUS_OK}
+
+    def append(self, record: dict):
+        """Durably append one record as soon as a supplement finishes."""
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compact(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Merge journaled ratings onto the supplement list, keeping any existing values not in the journal."""
+        records = self.load()
+        journaled = pd.DataFrame([{**record, 'status': record_status(record)} for record in records.values()],
+                                 columns=['url', 'rating', 'num_reviews', 'status'])
         
-        # Add columns for ratings data if they don't exist
         if 'rating' not in df.columns:
             df['rating'] = None
         if 'num_reviews' not in df.columns:
             df['num_reviews'] = None
+        df['status'] = fetch_status(df)
         
-        # Process each supplement
-        for idx, row in df.iterrows():
-            print(f"\nProcessing {row['name']} ({idx + 1}/{len(df)})...")
-            print(f"URL: {row['url']}")
-            
-            # Clean URL and update in DataFrame
-            cleaned_url = self.clean_url(row['url'])
-            df.at[idx, 'url'] = cleaned_url
-            print(f"Cleaned URL: {cleaned_url}")
-            
-            rating, num_reviews = self.get_ratings_from_review_url(row['url'])
-            print(f"Found rating: {rating}, num_reviews: {num_reviews}")
-            
-            # Update rating and review count in DataFrame
-            df.at[idx, 'rating'] = rating
-            df.at[idx, 'num_reviews'] = num_reviews
-            
-            time.sleep(1)  # Be nice to their servers
-            
-            # Save progress periodically
-            if idx % 100 == 0:
-                df.to_csv('webmd_supplement_ratings.csv', index=False)
-        
-        # Final save
-        df.to_csv('webmd_supplement_ratings.csv', index=False)
-        
+        df = df.merge(journaled, on='url', how='left', suffixes=('_previous', ''))
+        for col in ['rating', 'num_reviews', 'status']:
+            df[col] = df[col].combine_first(df.pop(f'{col}_previous'))
+        df['rating'] = pd.to_numeric(df['rating'])
+        df['num_reviews'] = pd.to_numeric(df['num_reviews']).astype('Int64')
         return df
 
 def main():
-    scraper = WebMDSupplementRatingsScraper()
-    df = scraper.scrape_all_ratings('webmd_supplement_urls.csv')
+    parser = argparse.ArgumentParser(description='Scrape WebMD ratings for every supplement URL')
+    parser.add_argument('--input', default='webmd_supplement_urls.csv')
+    parser.add_argument('--output', default='webmd_supplement_ratings.csv')
+    parser.add_argument('--store', help='Also write the ratings to the typed Parquet dataset in this directory')
+    parser.add_argument('--db', help='Also record a ratings snapshot in this SQLite review store (see review_db.py)')
+    parser.add_argument('--resume', action='store_true', help='Skip supplements already fetched in the checkpoint journal, rated or not')
+    parser.add_argument('--workers', type=int, default=8, help='Review pages fetched concurrently')
+    parser.add_argument('--changes', help='Diff from webmd-supplement-index-scraper.py; only added and renamed '
+                        'supplements are fetched, the rest keep their ratings from the existing --output')
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+    
+    with instrumented_run('webmd-ratings', args.report, args.profile):
+        scraper = WebMDSupplementRatingsScraper(max_workers=args.workers)
+        carry_over = None
+        if args.changes and os.path.exists(args.output):
+            changes = pd.read_csv(args.changes)
+            changed = set(changes.loc[changes['change'].isin(['added', 'renamed']), 'url'].map(scraper.clean_url))
+            previous = pd.read_csv(args.output)
+            carry_over = previous[~previous['url'].isin(changed)]
+        df = scraper.scrape_all_ratings(args.input, args.output, resume=args.resume, carry_over=carry_over)
+        if args.store:
+            write_supplement_ratings(df, args.store)
+        if args.db:
+            db = ReviewDB(args.db)
+            db.record_ratings(df)
+            db.close()
+        if scraper.client.cache is not None:
+            print(scraper.client.cache.report())
+        if scraper.client.rate_limiter is not None:
+            print(scraper.client.rate_limiter.report())
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
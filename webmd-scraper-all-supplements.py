@@ -1,28 +1,92 @@
-import requests
-from bs4 import BeautifulSoup
+import argparse
 import json
+import math
 import csv
+import functools
+import os
 from datetime import datetime
-import time
 import re
+import threading
+import queue
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Optional
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from parquet_store import write_webmd_reviews
+from review_db import ReviewDB, review_key
+from review_frames import frame_to_records, iter_review_frames
+from review_sinks import FanOutSink, ParquetSink, SQLiteSink, open_sink
+from webmd_extract import SchemaSelector, extract_initial_state, extract_review_count, extract_reviews
+from webmd_archive import ResponseArchive
+from webmd_http import ReplayClient, WebMDClient, get_default_client
+from webmd_instrument import add_instrumentation_args, get_recorder, instrumented_run
 
 @dataclass
 class ReviewTarget:
     name: str
     base_url: str
-    num_pages: int
     condition_id: str
     is_supplement: bool
+    num_pages: Optional[int] = None  # Discovered from page 1 when not set
+
+    @property
+    def schema_hint(self) -> str:
+        """Schema to try first when probing the target's first page."""
+        return 'supplement_state' if self.is_supplement else 'drug_state'
+
+def completed_future(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+@dataclass
+class RawPage:
+    """Undecoded page body handed from the fetcher threads to the parser processes."""
+    url: str
+    content: bytes
+    encoding: Optional[str]
+
+# Safety cap when paging a target whose page count could not be discovered
+MAX_PAGES = 500
+
+@functools.lru_cache(maxsize=65536)
+def format_review_date(date_str: str) -> str:
+    """WebMD's DatePosted as YYYY-MM-DD, or unchanged if it can't be parsed; reviews share timestamps, so it is cached."""
+    try:
+        return datetime.strptime(date_str, '%m/%d/%Y %I:%M:%S %p').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return date_str
+
+def parse_raw_page(page: RawPage, schemas: List[str], source: str) -> Tuple[Optional[str], List[dict]]:
+    """Parser-process stage: extract the page's reviews with the first matching schema and normalize them."""
+    extracted = extract_reviews(page.content.decode(page.encoding or 'utf-8', errors='replace'), schemas)
+    if extracted is None:
+        return None, []
+    return extracted.schema, [WebMDReviewScraper.parse_review(review, source) for review in extracted.reviews]
+
+@dataclass
+class HighWaterMark:
+    """Newest review date already collected for a target, plus the keys seen on that date."""
+    review_date: str
+    keys: List[str]
+
+    def is_known(self, review: dict) -> bool:
+        if review['review_date'] != self.review_date:
+            return review['review_date'] < self.review_date
+        return review_key(review) in self.keys
 
 class WebMDReviewScraper:
-    def __init__(self):
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-        }
+    def __init__(self, max_workers: int = 4, client: Optional[WebMDClient] = None,
+                 parse_workers: int = 0, queue_size: int = 16):
+        self.max_workers = max_workers
+        # With parse_workers > 0, pages are parsed in a process pool fed through a bounded queue
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+        self.client = client or get_default_client()
+        self.schemas = SchemaSelector()
 
     def get_url_for_page(self, target: ReviewTarget, page_number: int) -> str:
         """Construct the exact URL for a given page number."""
@@ -30,43 +94,12 @@ class WebMDReviewScraper:
 
     def extract_json_from_html(self, html_content: str) -> Optional[dict]:
         """Extract the JSON data containing reviews from the HTML."""
-        try:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            scripts = soup.find_all('script')
-            
-            for script in scripts:
-                if not script.string:
-                    continue
-                
-                if '__INITIAL_STATE__' in script.string:
-                    if script.string.startswith('window.__INITIAL_STATE__='):
-                        try:
-                            json_str = script.string.split('=', 1)[1].strip()
-                            if json_str.endswith(';'):
-                                json_str = json_str[:-1]
-                            
-                            data = json.loads(json_str)
-                            if 'vitamins_data' in data or 'drugs_data' in data:
-                                return data
-                            
-                        except Exception as e:
-                            print(f"Error parsing JSON: {str(e)}")
-                            continue
-            
-            return None
-            
-        except Exception as e:
-            print(f"Error extracting JSON: {str(e)}")
-            return None
+        return extract_initial_state(html_content)
 
-    def parse_review(self, review: dict, source: str) -> dict:
+    @staticmethod
+    def parse_review(review: dict, source: str) -> dict:
         """Parse a single review into a dictionary with the desired fields."""
-        date_str = review.get('DatePosted', '')
-        try:
-            date_obj = datetime.strptime(date_str, '%m/%d/%Y %I:%M:%S %p')
-            formatted_date = date_obj.strftime('%Y-%m-%d')
-        except:
-            formatted_date = date_str
+        formatted_date = format_review_date(review.get('DatePosted', ''))
 
         return {
             'source': source,
@@ -86,48 +119,311 @@ class WebMDReviewScraper:
 
     def get_page(self, target: ReviewTarget, page_number: int) -> list:
         """Get a single page of reviews."""
+        return self.get_page_with_count(target, page_number, with_count=False)[0]
+
+    def get_page_with_count(self, target: ReviewTarget, page_number: int,
+                            with_count: bool = True) -> Tuple[list, Optional[int]]:
+        """Get a single page of reviews plus the target's total review count, if the page reports one."""
+        try:
+            return self.fetch_page(target, page_number, with_count)
+        except Exception as e:
+            get_recorder().count('page_errors')
+            print(f"Error getting page {page_number}: {str(e)}")
+            return [], None
+
+    def fetch_page(self, target: ReviewTarget, page_number: int,
+                   with_count: bool = True) -> Tuple[list, Optional[int]]:
+        """Like get_page_with_count, but raises instead of returning an empty page.
+
+        A page no schema matches (a block or captcha page, or a new layout served with 200)
+        raises too, so callers can tell it from a page past the last one.
+        """
         url = self.get_url_for_page(target, page_number)
         print(f"Fetching URL: {url}")
+        recorder = get_recorder()
         
-        try:
-            response = requests.get(url, headers=self.headers)
+        with recorder.stage('fetch', target.name, page_number):
+            response = self.client.get(url)
             response.raise_for_status()
+        
+        with recorder.stage('extract', target.name, page_number):
+            # Page 1 probes the registered schemas; later pages go straight to the one that matched
+            extracted = self.schemas.extract(response.text, url, target.name, target.schema_hint)
+            if extracted is None:
+                # Don't let the cache hand the same unusable page to the retry
+                self.client.invalidate(url)
+                raise ValueError(f"No review schema matched {url}")
+                
+            reviews = extracted.reviews
+            review_count = (extract_review_count(response.text, *extracted.containers,
+                                                 filtered=bool(target.condition_id)) if with_count else None)
+        
+        print(f"Found {len(reviews)} reviews on page {page_number}")
+        if not reviews:
+            recorder.count('empty_pages')
+        return reviews, review_count
+
+    def discover_page_count(self, target: ReviewTarget) -> Tuple[list, Optional[int]]:
+        """Fetch page 1 and work out how many pages the target has from its review count."""
+        reviews, review_count = self.get_page_with_count(target, 1)
+        if not reviews:
+            return reviews, 1
+        if review_count is None:
+            print(f"Could not find a review count for {target.name}; paging until the first empty page")
+            return reviews, None
+        
+        num_pages = max(math.ceil(review_count / len(reviews)), 1)
+        print(f"{target.name}: {review_count} reviews across {num_pages} pages")
+        return reviews, num_pages
+
+    def iter_pages_until_empty(self, target: ReviewTarget, start_page: int) -> Iterator[list]:
+        """Fallback for unknown page counts: fetch pages in order until one comes back empty."""
+        for page in range(start_page, MAX_PAGES + 1):
+            reviews = self.get_page(target, page)
+            if not reviews:
+                break
+            yield reviews
+
+    def fetch_raw_page(self, target: ReviewTarget, page_number: int) -> Optional[RawPage]:
+        """Fetch a page without parsing it, for the process-pool pipeline."""
+        url = self.get_url_for_page(target, page_number)
+        print(f"Fetching URL: {url}")
+        
+        try:
+            with get_recorder().stage('fetch', target.name, page_number):
+                response = self.client.get(url)
+                response.raise_for_status()
+            return RawPage(url, response.content, response.encoding)
+        except Exception as e:
+            get_recorder().count('page_errors')
+            print(f"Error getting page {page_number}: {str(e)}")
+            return None
+
+    def iter_page_futures(self, targets: List[ReviewTarget], executor: ThreadPoolExecutor,
+                          fetch: Callable) -> Iterator[Tuple[ReviewTarget, Future]]:
+        """Submit fetch(target, page) for every page in target and page order, yielding (target, future).
+
+        Pages are only submitted as the caller asks for them, so the caller bounds how far
+        fetching runs ahead. Page 1 and fallback pages resolve to already extracted raw reviews.
+        """
+        group_size = self.max_workers * 2
+        # Targets are handled in groups, so only a group's first pages are held at once
+        for start in range(0, len(targets), group_size):
+            group = targets[start:start + group_size]
             
-            # Extract JSON data
-            json_data = self.extract_json_from_html(response.text)
-            if not json_data:
-                return []
+            # Page 1 of every target without a configured page count tells us how many pages it has
+            discovery = {target.name: executor.submit(self.discover_page_count, target)
+                         for target in group if target.num_pages is None}
+            
+            for target in group:
+                first_page = 1
+                if target.num_pages is None:
+                    reviews, num_pages = discovery[target.name].result()
+                    yield target, completed_future(reviews)
+                    if num_pages is None:
+                        for reviews in self.iter_pages_until_empty(target, 2):
+                            yield target, completed_future(reviews)
+                        continue
+                    first_page = 2
+                else:
+                    num_pages = target.num_pages
                 
-            # Navigate to reviews in the JSON structure based on type
-            if target.is_supplement:
-                data_container = json_data.get('vitamins_data', {})
-                reviews = data_container.get('vitamin_review_nimvs', [{}])[0].get('review_nimvs', [])
-            else:
-                data_container = json_data.get('drugs_data', {})
-                reviews = data_container.get('drug_review_nimvs', [{}])[0].get('review_nimvs', [])
+                for page in range(first_page, num_pages + 1):
+                    yield target, executor.submit(fetch, target, page)
+
+    def iter_pages(self, targets: List[ReviewTarget]) -> Iterator[Tuple[ReviewTarget, list]]:
+        """Yield (target, raw reviews) in target and page order, fetching ahead within a bounded window."""
+        window_size = self.max_workers * 2
+        window: Deque[Tuple[ReviewTarget, Future]] = deque()
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='webmd-fetch') as executor:
+            for target, future in self.iter_page_futures(targets, executor, self.get_page):
+                window.append((target, future))
+                while len(window) > window_size:
+                    target, future = window.popleft()
+                    yield target, future.result()
             
-            print(f"Found {len(reviews)} reviews on page {page_number}")
-            return reviews
+            while window:
+                target, future = window.popleft()
+                yield target, future.result()
+
+    def iter_reviews_pipelined(self, targets: List[ReviewTarget]) -> Iterator[dict]:
+        """Stream parsed reviews with fetching and parsing decoupled.
+
+        Fetcher threads push raw page bytes onto a bounded queue; the consumer hands them to
+        a pool of parse_workers processes and yields their results in target and page order.
+        """
+        raw_pages: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        errors: List[Exception] = []
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='webmd-fetch') as fetchers, \
+                ProcessPoolExecutor(max_workers=self.parse_workers) as parsers:
+            def produce():
+                try:
+                    for item in self.iter_page_futures(targets, fetchers, self.fetch_raw_page):
+                        # Blocks while the queue is full, so fetchers can't outrun the parsers
+                        raw_pages.put(item)
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    raw_pages.put(None)
             
-        except Exception as e:
-            print(f"Error getting page {page_number}: {str(e)}")
-            return []
+            producer = threading.Thread(target=produce, name='webmd-pages', daemon=True)
+            producer.start()
+            
+            parsed: Deque[Future] = deque()
+            while True:
+                item = raw_pages.get()
+                if item is None:
+                    break
+                target, future = item
+                page = future.result()
+                if isinstance(page, RawPage):
+                    schemas = self.schemas.candidates(target.name, page.url, target.schema_hint)
+                    parsed.append((target, page.url, parsers.submit(parse_raw_page, page, schemas, target.name)))
+                else:
+                    reviews = [self.parse_review(review, target.name) for review in page or []]
+                    parsed.append((target, None, completed_future((None, reviews))))
+                # Waiting on the oldest page here stops the queue draining until the parsers catch up
+                while len(parsed) > self.parse_workers * 2:
+                    yield from self._parsed_result(*parsed.popleft())
+            
+            while parsed:
+                yield from self._parsed_result(*parsed.popleft())
+        
+        if errors:
+            raise errors[0]
+
+    def _parsed_result(self, target: ReviewTarget, url: Optional[str], future: Future) -> List[dict]:
+        # Parsing happens in another process, so the time spent waiting on it is what this side can see
+        with get_recorder().stage('parse_wait'):
+            schema, reviews = future.result()
+        # Pages parsed in this process were already recorded by get_page_with_count
+        if url is not None:
+            self.schemas.record(target.name, url, schema)
+            if schema is None:
+                self.client.invalidate(url)
+        return reviews
+
+    def parse_page(self, target: ReviewTarget, reviews: list) -> List[dict]:
+        """Parse one page of raw reviews, timed as the page's parse stage."""
+        with get_recorder().stage('parse', target.name):
+            return [self.parse_review(review, target.name) for review in reviews]
+
+    def iter_reviews(self, targets: List[ReviewTarget]) -> Iterator[dict]:
+        """Stream parsed reviews: fetch -> extract -> parse_review, without holding whole targets in memory."""
+        if self.parse_workers:
+            yield from self.iter_reviews_pipelined(targets)
+            return
+        for target, reviews in self.iter_pages(targets):
+            yield from self.parse_page(target, reviews)
+
+    def iter_review_frames(self, targets: List[ReviewTarget], batch_size: int = 5000) -> Iterator[pd.DataFrame]:
+        """Stream reviews as typed frames (see review_frames.py), normalizing about batch_size reviews at a time."""
+        yield from iter_review_frames(((target.name, reviews) for target, reviews in self.iter_pages(targets)), batch_size)
 
     def scrape_reviews(self, target: ReviewTarget) -> list:
         """Scrape reviews for a specific target."""
-        all_reviews = []
+        return self.scrape_targets([target])[target.name]
+
+    def scrape_targets(self, targets: List[ReviewTarget]) -> Dict[str, list]:
+        """Scrape pages of several targets concurrently, returning reviews per target in page order."""
+        results = {target.name: [] for target in targets}
+        for review in self.iter_reviews(targets):
+            results[review['source']].append(review)
+        return results
+
+    def scrape_new_reviews(self, target: ReviewTarget, mark: HighWaterMark) -> Tuple[list, bool]:
+        """Walk pages newest-first (sortval=1) and stop at the first review already collected.
+
+        Returns the new reviews and whether the walk got there; a page that fails to load
+        ends it early, and the reviews between that page and the mark are still missing.
+        """
+        new_reviews = []
         
-        for page in range(1, target.num_pages + 1):
-            print(f"\nProcessing {target.name} - page {page}...")
-            reviews = self.get_page(target, page)
-            
-            for review in reviews:
-                parsed_review = self.parse_review(review, target.name)
-                all_reviews.append(parsed_review)
+        for page in range(1, (target.num_pages or MAX_PAGES) + 1):
+            try:
+                reviews, _ = self.fetch_page(target, page, with_count=False)
+            except Exception as e:
+                get_recorder().count('page_errors')
+                print(f"Error getting page {page} of {target.name}: {str(e)}")
+                return new_reviews, False
+            if not reviews:
+                break
                 
-            time.sleep(1)  # Be nice to their servers
-            
-        return all_reviews
+            for parsed_review in self.parse_page(target, reviews):
+                if mark.is_known(parsed_review):
+                    return new_reviews, True
+                new_reviews.append(parsed_review)
+                
+        return new_reviews, True
+
+    def scrape_targets_incremental(self, targets: List[ReviewTarget],
+                                   marks: Dict[str, HighWaterMark]) -> Tuple[Dict[str, list], List[str]]:
+        """Fetch only reviews newer than each target's high-water mark; unseen targets are scraped in full.
+
+        Also returns the targets whose walk was cut short by a failed page; their marks must not advance.
+        """
+        known = [target for target in targets if target.name in marks]
+        results = self.scrape_targets([target for target in targets if target.name not in marks])
+        failed = []
+        
+        # Paging within a target is sequential, but the targets run concurrently
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='webmd-fetch') as executor:
+            futures = {target.name: executor.submit(self.scrape_new_reviews, target, marks[target.name])
+                       for target in known}
+            for name, future in futures.items():
+                results[name], complete = future.result()
+                if not complete:
+                    failed.append(name)
+                
+        return results, failed
+
+def load_high_water_marks(filename: str) -> Dict[str, HighWaterMark]:
+    """Load per-target high-water marks saved by a previous run."""
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, encoding='utf-8') as f:
+        return {name: HighWaterMark(**mark) for name, mark in json.load(f).items()}
+
+def save_high_water_marks(marks: Dict[str, HighWaterMark], filename: str):
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump({name: vars(mark) for name, mark in marks.items()}, f, indent=2)
+
+def update_high_water_marks(marks: Dict[str, HighWaterMark], reviews: Iterable[dict]):
+    """Advance each target's mark to the newest reviews collected in this run."""
+    for review in reviews:
+        advance_high_water_mark(marks, review)
+
+def advance_high_water_mark(marks: Dict[str, HighWaterMark], review: dict):
+    """Advance the mark of the review's target if the review is at or past it."""
+    mark = marks.get(review['source'])
+    if mark is None or review['review_date'] > mark.review_date:
+        marks[review['source']] = HighWaterMark(review['review_date'], [review_key(review)])
+    elif review['review_date'] == mark.review_date and review_key(review) not in mark.keys:
+        mark.keys.append(review_key(review))
+
+def merge_reviews(existing: list, results: Dict[str, list]) -> list:
+    """Put new reviews ahead of each target's existing rows, dropping any already present."""
+    by_source: Dict[str, list] = {}
+    for review in existing:
+        by_source.setdefault(review['source'], []).append(review)
+        
+    merged = []
+    for name in list(results) + [name for name in by_source if name not in results]:
+        old_reviews = by_source.get(name, [])
+        seen = {review_key(review) for review in old_reviews}
+        new_reviews = [review for review in results.get(name, []) if review_key(review) not in seen]
+        merged.extend(new_reviews + old_reviews)
+        
+    return merged
+
+def load_from_csv(filename: str) -> list:
+    """Load previously saved reviews, or an empty list if the file does not exist."""
+    if not os.path.exists(filename):
+        return []
+    with open(filename, newline='', encoding='utf-8') as csvfile:
+        return list(csv.DictReader(csvfile))
 
 def save_to_csv(reviews: list, filename: str = 'webmd_reviews.csv'):
     """Save the reviews to a CSV file."""
@@ -150,65 +446,131 @@ def main():
         # ReviewTarget(
         #     name="Chanca Piedra",
         #     base_url="https://reviews.webmd.com/vitamins-supplements/ingredientreview-441-chanca-piedra",
-        #     num_pages=6,
         #     condition_id="",
         #     is_supplement=True
         # ),
         # ReviewTarget(
         #     name="Flomax",
         #     base_url="https://reviews.webmd.com/drugs/drugreview-4154-flomax-oral",
-        #     num_pages=2,
         #     condition_id="4139",
         #     is_supplement=False
         # ),
         # ReviewTarget(
         #     name="Hydrochlorothiazide",
         #     base_url="https://reviews.webmd.com/drugs/drugreview-5310-hydrochlorothiazide-oral",
-        #     num_pages=2,
         #     condition_id="2281",
         #     is_supplement=False
         # ),
         # ReviewTarget(
         #     name="Ashwagandha",
         #     base_url="https://reviews.webmd.com/vitamins-supplements/ingredientreview-953-ashwagandha",
-        #     num_pages=15,
         #     condition_id="",
         #     is_supplement=True
         # ),
         # ReviewTarget(
         #     name="Melatonin",
         #     base_url="https://reviews.webmd.com/vitamins-supplements/ingredientreview-940-melatonin",
-        #     num_pages=5,
         #     condition_id="1310",
         #     is_supplement=True
         # ),
         ReviewTarget(
             name="Black Seed",
             base_url="https://reviews.webmd.com/vitamins-supplements/ingredientreview-901-black-seed",
-            num_pages=5,
             condition_id="",
             is_supplement=True
         ),
         ReviewTarget(
             name="Garcinia",
             base_url="https://reviews.webmd.com/vitamins-supplements/ingredientreview-818-GARCINIA",
-            num_pages=49,
             condition_id="",
             is_supplement=True
         ),
     ]
     
-    scraper = WebMDReviewScraper()
-    all_reviews = []
+    parser = argparse.ArgumentParser(description='Scrape WebMD reviews for the configured targets')
+    parser.add_argument('--output', default='webmd_all_reviews_black_seed_garcinia.csv',
+                        help='.csv or .jsonl file, or a Parquet dataset directory')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only fetch reviews newer than the last run and merge them into --output (.csv only)')
+    parser.add_argument('--state', default='webmd_review_state.json', help='High-water marks per target')
+    parser.add_argument('--store', help='Also write the reviews to the typed Parquet dataset in this directory')
+    parser.add_argument('--db', help='Also upsert the reviews into this SQLite review store (see review_db.py)')
+    parser.add_argument('--parse-workers', type=int, default=0,
+                        help='Parse pages in this many processes instead of the fetcher threads')
+    parser.add_argument('--queue-size', type=int, default=16,
+                        help='Fetched pages allowed to wait for a parser before fetching pauses')
+    parser.add_argument('--columnar', action='store_true',
+                        help='Normalize pages in batches into typed frames instead of one dict per review')
+    parser.add_argument('--replay', action='store_true',
+                        help='Re-parse the pages stored in the response archive instead of fetching them')
+    parser.add_argument('--archive', default='.response_archive', help='Response archive directory for --replay')
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+    if args.incremental and not args.output.endswith('.csv'):
+        parser.error('--incremental merges new reviews into a .csv --output')
+    if args.columnar and args.parse_workers:
+        parser.error('--columnar builds its frames in this process and cannot be combined with --parse-workers')
+    
+    with instrumented_run('webmd-reviews', args.report, args.profile):
+        run(args, targets)
+
+def run(args: argparse.Namespace, targets: List[ReviewTarget]):
+    # Replayed pages are read from the archive, which has no rate limit
+    client = ReplayClient(ResponseArchive(args.archive)) if args.replay else None
+    scraper = WebMDReviewScraper(max_workers=4, client=client,
+                                 parse_workers=args.parse_workers, queue_size=args.queue_size)
+    marks = load_high_water_marks(args.state)
     
-    for target in targets:
-        print(f"\nStarting to scrape {target.name}...")
-        reviews = scraper.scrape_reviews(target)
-        all_reviews.extend(reviews)
-        print(f"Completed {target.name} - found {len(reviews)} reviews")
-        time.sleep(2)  # Extra pause between different supplements
+    print(f"\nStarting to scrape {', '.join(target.name for target in targets)}...")
+    if args.incremental:
+        results, failed = scraper.scrape_targets_incremental(targets, marks)
+        for target in targets:
+            print(f"Completed {target.name} - found {len(results[target.name])} new reviews")
+        if failed:
+            print(f"Pages failed for {', '.join(failed)}; keeping their high-water marks so the next run fetches the gap")
+        
+        reviews = merge_reviews(load_from_csv(args.output), results)
+        with get_recorder().stage('write'):
+            save_to_csv(reviews, args.output)
+        if args.store and reviews:
+            write_webmd_reviews(pd.DataFrame(reviews), args.store)
+        if args.db:
+            db = ReviewDB(args.db)
+            print(f"Upserted {db.upsert_reviews(r for new_reviews in results.values() for r in new_reviews)} "
+                  f"new reviews into {args.db}")
+            db.close()
+        update_high_water_marks(marks, (review for name, new_reviews in results.items() if name not in failed
+                                        for review in new_reviews))
+    else:
+        # Rows go to the sinks as they arrive, so memory stays flat however many targets are configured
+        sinks = [open_sink(args.output)] + ([ParquetSink(args.store)] if args.store else [])
+        if args.db:
+            sinks.append(SQLiteSink(ReviewDB(args.db)))
+        counts = Counter()
+        with FanOutSink(sinks) as sink:
+            if args.columnar:
+                for frame in scraper.iter_review_frames(targets):
+                    sink.write_frame(frame)
+                    # Only each target's newest reviews in the frame can move its high-water mark
+                    newest = frame.groupby('source', observed=True)['review_date'].transform('max')
+                    update_high_water_marks(marks, frame_to_records(frame[frame['review_date'] == newest]))
+                    counts.update(frame['source'].value_counts().to_dict())
+            else:
+                for review in scraper.iter_reviews(targets):
+                    sink.write(review)
+                    advance_high_water_mark(marks, review)
+                    counts[review['source']] += 1
+        for target in targets:
+            print(f"Completed {target.name} - found {counts[target.name]} reviews")
     
-    save_to_csv(all_reviews, 'webmd_all_reviews_black_seed_garcinia.csv')
+    save_high_water_marks(marks, args.state)
+    if scraper.client.cache is not None:
+        print(scraper.client.cache.report())
+    if scraper.client.archive is not None:
+        print(scraper.client.archive.report())
+    if scraper.client.rate_limiter is not None:
+        print(scraper.client.rate_limiter.report())
+    print(scraper.schemas.report())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
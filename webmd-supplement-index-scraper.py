@@ -1,17 +1,64 @@
-import requests
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from html import unescape
 from bs4 import BeautifulSoup
 import pandas as pd
-import time
 import re
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import string
 
+from review_db import ReviewDB
+from webmd_http import WebMDClient, get_default_client
+from webmd_instrument import add_instrumentation_args, get_recorder, instrumented_run
+
+SUPPLEMENT_HREF_RE = re.compile(r'/vitamins/ai/ingredientmono-\d+/')
+# <a ... href="/vitamins/ai/ingredientmono-123/slug" ...>Name</a>, matched without building a DOM
+SUPPLEMENT_LINK_RE = re.compile(
+    r'<a\s[^>]*?href\s*=\s*(["\'])([^"\']*/vitamins/ai/ingredientmono-\d+/[^"\']*)\1[^>]*>(.*?)</a\s*>', re.S | re.I)
+TAG_RE = re.compile(r'<[^>]+>')
+INGREDIENT_ID_RE = re.compile(r'ingredientmono-(\d+)')
+
+def extract_supplement_links(html: str) -> List[Tuple[str, str]]:
+    """Return (name, href) for every supplement link on a letter page."""
+    links = [(unescape(TAG_RE.sub('', text)).strip(), unescape(href))
+             for _, href, text in SUPPLEMENT_LINK_RE.findall(html)]
+    if links:
+        return links
+    # Fall back to a full parse in case the markup changed shape
+    soup = BeautifulSoup(html, 'html.parser')
+    return [(link.text.strip(), link['href']) for link in soup.find_all('a', href=SUPPLEMENT_HREF_RE)]
+
+def ingredient_id(url: str) -> Optional[str]:
+    match = INGREDIENT_ID_RE.search(url)
+    return match.group(1) if match else None
+
+def diff_supplements(previous: pd.DataFrame, current: pd.DataFrame) -> pd.DataFrame:
+    """Compare two crawls by WebMD ingredient id: added, removed and renamed (new name or URL) supplements."""
+    columns = ['name', 'url', 'letter']
+    old = previous[columns].assign(id=previous['url'].map(ingredient_id)).drop_duplicates('id')
+    new = current[columns].assign(id=current['url'].map(ingredient_id)).drop_duplicates('id')
+    merged = new.merge(old, on='id', how='outer', suffixes=('', '_previous'), indicator=True)
+    
+    merged['change'] = None
+    merged.loc[merged['_merge'] == 'left_only', 'change'] = 'added'
+    merged.loc[merged['_merge'] == 'right_only', 'change'] = 'removed'
+    renamed = (merged['_merge'] == 'both') & ((merged['name'] != merged['name_previous'])
+                                              | (merged['url'] != merged['url_previous']))
+    merged.loc[renamed, 'change'] = 'renamed'
+    
+    # Removed supplements are described by their previous name and URL
+    removed = merged['change'] == 'removed'
+    for col in columns:
+        merged.loc[removed, col] = merged.loc[removed, f'{col}_previous']
+    changes = merged[merged['change'].notna()]
+    return changes[['change', 'id', 'name', 'url', 'letter', 'name_previous', 'url_previous']].reset_index(drop=True)
+
 class WebMDSupplementIndexScraper:
-    def __init__(self):
+    def __init__(self, client: Optional[WebMDClient] = None, max_workers: int = 8):
         self.base_url = "https://www.webmd.com/vitamins/alpha"
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
+        self.client = client or get_default_client()
+        self.max_workers = max_workers
         
     def get_letter_page_urls(self) -> List[str]:
         """Get list of all alphabetical index page URLs"""
@@ -23,43 +70,63 @@ class WebMDSupplementIndexScraper:
         urls.append(f"{self.base_url}/0")
         return urls
         
-    def get_supplements_from_page(self, url: str) -> List[Dict[str, str]]:
-        """Get all supplement URLs and names from a letter page"""
+    def get_supplements_from_page(self, url: str) -> Optional[List[Dict[str, str]]]:
+        """Get all supplement URLs and names from a letter page, or None if the page could not be fetched"""
+        print(f"Processing {url}...")
+        recorder = get_recorder()
+        letter = url.split('/')[-1]  # Get letter/number from URL
         try:
-            response = requests.get(url, headers=self.headers)
-            soup = BeautifulSoup(response.text, 'html.parser')
+            with recorder.stage('fetch', letter):
+                response = self.client.get(url)
+                response.raise_for_status()
             
-            supplements = []
-            # Find all supplement links in the page
-            links = soup.find_all('a', href=re.compile(r'/vitamins/ai/ingredientmono-\d+/'))
+            with recorder.stage('extract', letter):
+                supplements = []
+                # Find all supplement links in the page
+                for name, href in extract_supplement_links(response.text):
+                    supplements.append({
+                        'name': name,
+                        'url': f"https://www.webmd.com{href}",
+                        'letter': letter
+                    })
             
-            for link in links:
-                supplements.append({
-                    'name': link.text.strip(),
-                    'url': f"https://www.webmd.com{link['href']}",
-                    'letter': url.split('/')[-1]  # Get letter/number from URL
-                })
-                
+            if not supplements:
+                recorder.count('empty_pages')
             return supplements
             
         except Exception as e:
+            recorder.count('page_errors')
             print(f"Error processing {url}: {str(e)}")
-            return []
+            return None
 
-    def scrape_all_supplement_urls(self) -> pd.DataFrame:
-        """Scrape supplement URLs from all letter pages"""
-        all_supplements = []
+    def scrape_all_supplement_urls(self, output_csv: str = 'webmd_supplement_urls.csv',
+                                   diff_csv: str = 'webmd_supplement_urls.diff.csv') -> pd.DataFrame:
+        """Scrape supplement URLs from all letter pages concurrently, and diff them against the last crawl"""
         letter_urls = self.get_letter_page_urls()
+        previous = pd.read_csv(output_csv, dtype={'letter': str}) if os.path.exists(output_csv) else None
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='webmd-fetch') as executor:
+            # map keeps the letters in order however the fetches finish
+            pages = list(executor.map(self.get_supplements_from_page, letter_urls))
         
-        for url in letter_urls:
-            print(f"Processing {url}...")
-            supplements = self.get_supplements_from_page(url)
-            all_supplements.extend(supplements)
-            time.sleep(1)  # Be nice to their servers
+        all_supplements, failed_letters = [], []
+        for url, supplements in zip(letter_urls, pages):
+            if supplements is not None:
+                all_supplements.extend(supplements)
+                continue
+            # A failed letter keeps the previous crawl's rows, so its supplements aren't reported as removed
+            letter = url.split('/')[-1]
+            failed_letters.append(letter)
+            if previous is not None:
+                all_supplements.extend(previous[previous['letter'] == letter].to_dict('records'))
+        if failed_letters:
+            kept = 'kept the previous crawl\'s rows' if previous is not None else 'no previous crawl to fall back on'
+            print(f"\nFailed to fetch letters {', '.join(failed_letters)} ({kept}); rerun to retry them")
             
         # Convert to DataFrame and save
-        df = pd.DataFrame(all_supplements)
-        df.to_csv('webmd_supplement_urls.csv', index=False)
+        df = pd.DataFrame(all_supplements, columns=['name', 'url', 'letter'])
+        with get_recorder().stage('write'):
+            df.to_csv(output_csv, index=False)
         print(f"\nFound {len(df)} total supplements")
         
         # Print summary by letter
@@ -67,11 +134,36 @@ class WebMDSupplementIndexScraper:
         summary = df.groupby('letter').size()
         print(summary)
         
+        if previous is not None:
+            changes = diff_supplements(previous, df)
+            changes.to_csv(diff_csv, index=False)
+            counts = changes['change'].value_counts()
+            print(f"\nChanges since the last crawl: {counts.get('added', 0)} added, "
+                  f"{counts.get('removed', 0)} removed, {counts.get('renamed', 0)} renamed (saved to {diff_csv})")
+        
         return df
 
 def main():
-    scraper = WebMDSupplementIndexScraper()
-    df = scraper.scrape_all_supplement_urls()
+    parser = argparse.ArgumentParser(description='Scrape the WebMD supplement index into webmd_supplement_urls.csv')
+    parser.add_argument('--output', default='webmd_supplement_urls.csv')
+    parser.add_argument('--diff', default='webmd_supplement_urls.diff.csv',
+                        help='Where to save the added/removed/renamed supplements since the previous --output')
+    parser.add_argument('--workers', type=int, default=8, help='Letter pages fetched concurrently')
+    parser.add_argument('--db', help='Also upsert the supplements into this SQLite review store (see review_db.py)')
+    add_instrumentation_args(parser)
+    args = parser.parse_args()
+    
+    with instrumented_run('webmd-index', args.report, args.profile):
+        scraper = WebMDSupplementIndexScraper(max_workers=args.workers)
+        df = scraper.scrape_all_supplement_urls(args.output, args.diff)
+        if args.db:
+            db = ReviewDB(args.db)
+            db.upsert_supplements(df)
+            db.close()
+        if scraper.client.cache is not None:
+            print(scraper.client.cache.report())
+        if scraper.client.rate_limiter is not None:
+            print(scraper.client.rate_limiter.report())
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; segments fall back to zlib
+    zstandard = None
+
+SEGMENT_BYTES = 256 * 1024 * 1024
+
+@dataclass
+class ArchivedResponse:
+    url: str
+    body: bytes
+    headers: dict
+    encoding: Optional[str]
+    fetched_at: float
+    digest: str
+
+class ResponseArchive:
+    """Append-only archive of every fetched page, content-addressed by the SHA-256 of the body.
+
+    Bodies are compressed into numbered segment files; an SQLite index maps each
+    digest to its segment and offset, and each URL to the bodies fetched for it.
+    A body seen before (e.g. an unchanged page) is only indexed, never stored twice.
+    """
+    def __init__(self, directory: str = '.response_archive', segment_bytes: int = SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.lock = threading.Lock()
+        self.compressor = zstandard.ZstdCompressor(level=10) if zstandard is not None else None
+        self.decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                codec TEXT NOT NULL
+            )
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                headers TEXT,
+                encoding TEXT,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (url, digest)
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_fetched_at ON responses (url, fetched_at)")
+        self.db.commit()
+        self.segment = self.db.execute("SELECT COALESCE(MAX(segment), 1) FROM blobs").fetchone()[0]
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f'segment-{segment:06d}.bin')
+
+    def _compress(self, body: bytes):
+        if self.compressor is not None:
+            return self.compressor.compress(body), 'zstd'
+        return zlib.compress(body, 6), 'zlib'
+
+    def _decompress(self, data: bytes, codec: str) -> bytes:
+        if codec == 'zstd':
+            if self.decompressor is None:
+                raise ImportError("This archive has zstd segments: pip install zstandard")
+            return self.decompressor.decompress(data)
+        return zlib.decompress(data)
+
+    def record(self, url: str, body: bytes, headers: dict, encoding: Optional[str]):
+        """Archive a 200 response; only bodies not already in the archive are written out."""
+        digest = hashlib.sha256(body).hexdigest()
+        # The body is stored decoded, so transport headers no longer describe it
+        headers = {name: value for name, value in headers.items()
+                   if name.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')}
+
+        with self.lock:
+            known = self.db.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if known is None:
+                data, codec = self._compress(body)
+                path = self._segment_path(self.segment)
+                if os.path.exists(path) and os.path.getsize(path) + len(data) > self.segment_bytes:
+                    self.segment += 1
+                    path = self._segment_path(self.segment)
+                with open(path, 'ab') as f:
+                    offset = f.tell()
+                    f.write(data)
+                # The index only points at bytes that are already on disk, so a crash leaves at most unused tail bytes
+                self.db.execute("INSERT INTO blobs VALUES (?, ?, ?, ?, ?)",
+                                (digest, self.segment, offset, len(data), codec))
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (url, digest, json.dumps(headers), encoding, time.time()))
+            self.db.commit()
+
+    def read_body(self, digest: str) -> bytes:
+        with self.lock:
+            segment, offset, length, codec = self.db.execute(
+                "SELECT segment, offset, length, codec FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        return self._decompress(data, codec)
+
+    def latest(self, url: str) -> Optional[ArchivedResponse]:
+        """Return the most recently fetched version of a URL, or None if it was never archived."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT digest, headers, encoding, fetched_at FROM responses WHERE url = ? "
+                "ORDER BY fetched_at DESC LIMIT 1", (url,)).fetchone()
+        if row is None:
+            return None
+        digest, headers, encoding, fetched_at = row
+        return ArchivedResponse(url, self.read_body(digest), json.loads(headers), encoding, fetched_at, digest)
+
+    def iter_latest(self, url_prefix: str = '') -> Iterator[ArchivedResponse]:
+        """Yield the latest version of every archived URL starting with url_prefix, in URL order."""
+        with self.lock:
+            urls = [url for (url,) in self.db.execute(
+                "SELECT DISTINCT url FROM responses WHERE substr(url, 1, ?) = ? ORDER BY url",
+                (len(url_prefix), url_prefix))]
+        for url in urls:
+            yield self.latest(url)
+
+    def report(self) -> str:
+        """Summarize the archive's contents."""
+        with self.lock:
+            urls, versions = self.db.execute("SELECT COUNT(DISTINCT url), COUNT(*) FROM responses").fetchone()
+            blobs, stored = self.db.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM blobs").fetchone()
+        return (f"Response archive: {urls} URLs, {versions} versions, {blobs} distinct bodies, "
+                f"{stored / 1e6:.1f} MB compressed in {self.directory}")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# (URL pattern, TTL in seconds); the first match wins
+DEFAULT_TTL_RULES = [
+    (r'webmd\.com/vitamins/alpha/', 7 * 24 * 3600),  # Alphabetical index pages rarely change
+    (r'reviews\.webmd\.com/', 6 * 3600),             # Review pages pick up new reviews daily
+]
+DEFAULT_TTL = 24 * 3600
+
+@dataclass
+class CacheEntry:
+    url: str
+    body: bytes
+    headers: dict
+    encoding: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    stored_at: float
+    ttl: float
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() - self.stored_at < self.ttl
+
+    @property
+    def can_revalidate(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+class HTTPCache:
+    """On-disk HTTP cache keyed by URL, with compressed bodies, per-URL TTLs and LRU eviction."""
+    def __init__(self, directory: str = '.http_cache', max_bytes: int = 500 * 1024 * 1024,
+                 ttl_rules: Optional[List[Tuple[str, float]]] = None, default_ttl: float = DEFAULT_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_rules = [(re.compile(pattern), ttl) for pattern, ttl in (ttl_rules or DEFAULT_TTL_RULES)]
+        self.default_ttl = default_ttl
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                key TEXT NOT NULL,
+                headers TEXT,
+                encoding TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self.db.commit()
+
+    def ttl_for(self, url: str) -> float:
+        """Return the TTL for a URL from the first matching rule."""
+        for pattern, ttl in self.ttl_rules:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def _body_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + '.z')
+
+    def lookup(self, url: str) -> Optional[CacheEntry]:
+        """Return the cached entry for a URL, fresh or stale, or None."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT key, headers, encoding, etag, last_modified, stored_at FROM entries WHERE url = ?",
+                (url,)).fetchone()
+            if row is None:
+                return None
+            key, headers, encoding, etag, last_modified, stored_at = row
+            try:
+                with open(self._body_path(key), 'rb') as f:
+                    body = zlib.decompress(f.read())
+            except (OSError, zlib.error):
+                self.db.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self.db.commit()
+                return None
+            self.db.execute("UPDATE entries SET last_access = ? WHERE url = ?", (time.time(), url))
+            self.db.commit()
+        return CacheEntry(url, body, json.loads(headers), encoding, etag, last_modified, stored_at, self.ttl_for(url))
+
+    def store(self, url: str, body: bytes, headers: dict, encoding: Optional[str]):
+        """Compress and store a 200 response body with its validators."""
+        # The body is stored decoded, so transport headers no longer describe it
+        headers = {name: value for name, value in headers.items()
+                   if name.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')}
+        validators = {name.lower(): value for name, value in headers.items()}
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        path = self._body_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(body, 6)
+        with open(path, 'wb') as f:
+            f.write(compressed)
+
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, key, json.dumps(headers), encoding, validators.get('etag'), validators.get('last-modified'),
+                 now, now, len(compressed)))
+            self.db.commit()
+            self._evict()
+
+    def invalidate(self, url: str):
+        """Remove a URL's entry so the next request goes to the network."""
+        with self.lock:
+            row = self.db.execute("SELECT key FROM entries WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return
+            try:
+                os.remove(self._body_path(row[0]))
+            except OSError:
+                pass
+            self.db.execute("DELETE FROM entries WHERE url = ?", (url,))
+            self.db.commit()
+            self.stats['invalidated'] += 1
+
+    def touch(self, url: str):
+        """Mark a revalidated entry as fresh again."""
+        with self.lock:
+            now = time.time()
+            self.db.execute("UPDATE entries SET stored_at = ?, last_access = ? WHERE url = ?", (now, now, url))
+            self.db.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the store fits in max_bytes."""
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, key, size in self.db.execute(
+                "SELECT url, key, size FROM entries ORDER BY last_access").fetchall():
+            try:
+                os.remove(self._body_path(key))
+            except OSError:
+                pass
+            self.db.execute("DELETE FROM entries WHERE url = ?", (url,))
+            self.stats['evicted'] += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self.db.commit()
+
+    def count(self, name: str):
+        """Count a hit, miss or revalidation; the client calls this from many fetcher threads."""
+        with self.lock:
+            self.stats[name] += 1
+
+    def report(self) -> str:
+        """Summarize cache activity for the end of a run."""
+        return (f"HTTP cache: {self.stats['hit']} hits, {self.stats['miss']} misses, "
+                f"{self.stats['revalidated']} revalidated, {self.stats['invalidated']} invalidated, "
+                f"{self.stats['evicted']} evicted")
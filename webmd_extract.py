@@ -0,0 +1,311 @@
+import json
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from bs4 import BeautifulSoup
+
+from webmd_instrument import get_recorder
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the standard library decoder
+    orjson = None
+
+STATE_MARKER = 'window.__INITIAL_STATE__='
+STATE_KEYS = ('vitamins_data', 'drugs_data')
+
+# Keys that may carry the total number of reviews in the review block of the state
+REVIEW_COUNT_KEYS = ('totalreviews', 'totalReviews', 'TotalReviews', 'reviewCount', 'numFound')
+# The review tab shows the count as "(123)", e.g. <li class="active-tab"><a>Reviews <span>(123)</span>;
+# the match stays inside the active tab so another tab's count can't be picked up
+ACTIVE_TAB_COUNT_RE = re.compile(
+    r'<li[^>]*class="[^"]*active-tab[^"]*"[^>]*>(?:(?!</li>).)*?<span[^>]*>\s*\((\d+)\)\s*</span>', re.S)
+LD_JSON_COUNT_RE = re.compile(r'"reviewCount"\s*:\s*"?(\d+)')
+LD_JSON_RE = re.compile(r'<script[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script', re.S | re.I)
+
+def decode_json(text: str):
+    """Decode JSON with orjson when it is installed, otherwise with the json module."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def slice_initial_state(html_content: str) -> Optional[str]:
+    """Return the raw JSON text assigned to window.__INITIAL_STATE__, without building a DOM."""
+    start = html_content.find(STATE_MARKER)
+    if start == -1:
+        return None
+    start += len(STATE_MARKER)
+
+    # An inline script cannot contain a literal </script>, so it safely bounds the payload
+    end = html_content.find('</script', start)
+    if end == -1:
+        return None
+
+    json_str = html_content[start:end].strip()
+    if json_str.endswith(';'):
+        json_str = json_str[:-1]
+    return json_str
+
+def extract_initial_state_fast(html_content: str) -> Optional[dict]:
+    """Fast path: slice the state out of the raw HTML and decode it.
+
+    A state without review data (a page with no reviews) is still returned, so only a
+    page whose script can't be sliced or decoded needs the full parse.
+    """
+    json_str = slice_initial_state(html_content)
+    if not json_str:
+        return None
+    data = decode_json(json_str)
+    return data if isinstance(data, dict) else None
+
+def is_review_state(data) -> bool:
+    """Whether a decoded state looks like a review page's: a known data container or another *_data one."""
+    return isinstance(data, dict) and any(key in STATE_KEYS or key.endswith('_data') for key in data)
+
+def extract_review_count(html_content: str, *containers: dict, filtered: bool = False) -> Optional[int]:
+    """Find a target's total review count in the state containers, the active tab or the ld+json metadata.
+
+    The ld+json count covers every condition, so a condition-filtered page (filtered=True)
+    only trusts the state and its active tab, and gets None rather than the product total.
+    """
+    for container in containers:
+        for key in REVIEW_COUNT_KEYS:
+            value = container.get(key) if isinstance(container, dict) else None
+            if value not in (None, ''):
+                try:
+                    return int(value)
+                except (TypeError, ValueError):
+                    continue
+
+    for pattern in (ACTIVE_TAB_COUNT_RE,) if filtered else (ACTIVE_TAB_COUNT_RE, LD_JSON_COUNT_RE):
+        match = pattern.search(html_content)
+        if match:
+            return int(match.group(1))
+    return None
+
+def iter_ld_json_items(html_content: str) -> Iterator[dict]:
+    """Yield every item of the page's ld+json scripts, whether top-level, in a list or in an @graph."""
+    for match in LD_JSON_RE.finditer(html_content):
+        try:
+            data = decode_json(match.group(1))
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            data = data.get('@graph', [data])
+        for item in data if isinstance(data, list) else []:
+            if isinstance(item, dict):
+                yield item
+
+def extract_aggregate_rating(html_content: str) -> Tuple[Optional[float], Optional[int]]:
+    """Fast path for rating pages: the Product aggregateRating in the ld+json metadata, without building a DOM."""
+    for item in iter_ld_json_items(html_content):
+        if item.get('@type') != 'Product':
+            continue
+        aggregate = item.get('aggregateRating')
+        try:
+            return float(aggregate['ratingValue']), int(aggregate['reviewCount'])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None, None
+
+def extract_initial_state_bs4(html_content: str) -> Optional[dict]:
+    """Slow path: parse the full document with BeautifulSoup and scan every script."""
+    soup = BeautifulSoup(html_content, 'html.parser')
+    scripts = soup.find_all('script')
+
+    for script in scripts:
+        if not script.string:
+            continue
+
+        if script.string.startswith(STATE_MARKER):
+            try:
+                json_str = script.string.split('=', 1)[1].strip()
+                if json_str.endswith(';'):
+                    json_str = json_str[:-1]
+
+                data = json.loads(json_str)
+                if is_review_state(data):
+                    return data
+
+            except Exception as e:
+                print(f"Error parsing JSON: {str(e)}")
+                continue
+
+    return None
+
+def extract_initial_state(html_content: str) -> Optional[dict]:
+    """Extract the __INITIAL_STATE__ payload, falling back to BeautifulSoup if it can't be sliced or decoded."""
+    if STATE_MARKER not in html_content:
+        # Script text is never entity-encoded, so a full parse could not find it either
+        return None
+
+    try:
+        data = extract_initial_state_fast(html_content)
+        if data is not None:
+            return data
+    except Exception as e:
+        print(f"Fast JSON extraction failed, falling back to BeautifulSoup: {str(e)}")
+
+    try:
+        return extract_initial_state_bs4(html_content)
+    except Exception as e:
+        print(f"Error extracting JSON: {str(e)}")
+        return None
+
+@dataclass
+class ExtractedReviews:
+    """Raw reviews found on a page by one schema, in WebMD's review_nimvs shape."""
+    schema: str
+    reviews: List[dict]
+    containers: Tuple[dict, ...]  # Where extract_review_count looks for the target's total
+
+# A schema extractor gets the page HTML and its decoded state (None if the page has none) and
+# returns (reviews, containers), or None when the page is not in its layout. A page in the layout
+# with no reviews (past the last page) returns an empty list rather than None.
+SchemaExtractor = Callable[[str, Optional[dict]], Optional[Tuple[List[dict], Tuple[dict, ...]]]]
+
+# Review page layouts by name, probed in registration order
+REVIEW_SCHEMAS: Dict[str, SchemaExtractor] = {}
+
+def register_schema(name: str) -> Callable[[SchemaExtractor], SchemaExtractor]:
+    """Decorator adding a review page layout to the registry."""
+    def register(extractor: SchemaExtractor) -> SchemaExtractor:
+        REVIEW_SCHEMAS[name] = extractor
+        return extractor
+    return register
+
+def _state_schema(data_key: str, block_key: str) -> SchemaExtractor:
+    def extract(html_content: str, state: Optional[dict]):
+        container = (state or {}).get(data_key)
+        if not isinstance(container, dict) or block_key not in container:
+            return None
+        review_block = (container[block_key] or [{}])[0]
+        return review_block.get('review_nimvs', []), (review_block, container)
+    return extract
+
+register_schema('supplement_state')(_state_schema('vitamins_data', 'vitamin_review_nimvs'))
+register_schema('drug_state')(_state_schema('drugs_data', 'drug_review_nimvs'))
+
+def _find_review_block(node, parent: Optional[dict] = None, depth: int = 0) -> Optional[Tuple[dict, dict]]:
+    """Depth-first search of the state for the first dict holding a review_nimvs list; returns (block, parent)."""
+    if depth > 5:
+        return None
+    if isinstance(node, dict):
+        if isinstance(node.get('review_nimvs'), list):
+            return node, parent or node
+        children = node.values()
+    elif isinstance(node, list):
+        children = node
+    else:
+        return None
+    for child in children:
+        found = _find_review_block(child, node if isinstance(node, dict) else parent, depth + 1)
+        if found is not None:
+            return found
+    return None
+
+@register_schema('state_scan')
+def _state_scan(html_content: str, state: Optional[dict]):
+    """Any other state layout that still carries review_nimvs, e.g. a renamed data container."""
+    found = _find_review_block(state) if state else None
+    if found is None:
+        return None
+    review_block, container = found
+    return review_block['review_nimvs'], (review_block, container)
+
+def _ld_json_review(review: dict) -> dict:
+    """Map a schema.org Review onto the review_nimvs fields that parse_review reads."""
+    author = review.get('author')
+    rating = review.get('reviewRating')
+    return {
+        'DisplayName': author.get('name', '') if isinstance(author, dict) else author or '',
+        'DatePosted': review.get('datePublished', ''),
+        'OverAll_UserReviewRating': rating.get('ratingValue', '') if isinstance(rating, dict) else '',
+        'UserExperience': review.get('reviewBody', ''),
+    }
+
+@register_schema('ld_json')
+def _ld_json_reviews(html_content: str, state: Optional[dict]):
+    """Pages without a review state that list their reviews in the ld+json metadata."""
+    for item in iter_ld_json_items(html_content):
+        reviews = item.get('review')
+        if isinstance(reviews, dict):
+            reviews = [reviews]
+        if isinstance(reviews, list):
+            aggregate = item.get('aggregateRating')
+            return ([_ld_json_review(review) for review in reviews if isinstance(review, dict)],
+                    (aggregate,) if isinstance(aggregate, dict) else ())
+    return None
+
+def extract_reviews(html_content: str, schemas: Optional[Iterable[str]] = None) -> Optional[ExtractedReviews]:
+    """Try the given schemas (default: all registered ones) in order; returns the first that matches the page."""
+    state = extract_initial_state(html_content)
+    for name in REVIEW_SCHEMAS if schemas is None else schemas:
+        found = REVIEW_SCHEMAS[name](html_content, state)
+        if found is not None:
+            return ExtractedReviews(name, *found)
+    return None
+
+def site_section(url: str) -> str:
+    """Host and first path segment of a URL, e.g. reviews.webmd.com/drugs; pages in a section share a layout."""
+    parsed = urlparse(url)
+    return f"{parsed.netloc}/{parsed.path.strip('/').split('/')[0]}"
+
+class SchemaSelector:
+    """Chooses each target's review schema by probing its first page, then goes straight to it.
+
+    The schema that matched is cached per target and per site section, so later pages
+    only run one extractor and a new target tries its section's schema right after its
+    own hint. A cached schema that stops matching is counted as a miss and the page is
+    probed again.
+    """
+    def __init__(self):
+        self.by_target: Dict[str, str] = {}
+        self.by_section: Dict[str, str] = {}
+        self.pages = Counter()
+        self.misses = Counter()
+        self.lock = threading.Lock()
+
+    def candidates(self, target: str, url: str, preferred: Optional[str] = None) -> List[str]:
+        """Schemas to try for a page, most likely first."""
+        with self.lock:
+            first = [self.by_target.get(target), preferred, self.by_section.get(site_section(url))]
+        return list(dict.fromkeys(name for name in first + list(REVIEW_SCHEMAS) if name is not None))
+
+    def record(self, target: str, url: str, schema: Optional[str]):
+        """Record which schema matched a page of target (None if none did) and cache it."""
+        with self.lock:
+            expected = self.by_target.get(target)
+            missed = [expected] if expected is not None and schema != expected else []
+            if schema is None:
+                missed.append('unmatched')
+            for name in missed:
+                self.misses[name] += 1
+                get_recorder().count(f'schema_misses.{name}')
+            if schema is None:
+                return
+            self.pages[schema] += 1
+            self.by_target[target] = schema
+            self.by_section[site_section(url)] = schema
+
+    def extract(self, html_content: str, url: str, target: str,
+                preferred: Optional[str] = None) -> Optional[ExtractedReviews]:
+        """Extract a page's reviews with the target's schema, probing the others if it has none or it misses."""
+        extracted = extract_reviews(html_content, self.candidates(target, url, preferred))
+        self.record(target, url, extracted.schema if extracted is not None else None)
+        return extracted
+
+    def report(self) -> str:
+        """Summarize the pages extracted and missed per schema."""
+        with self.lock:
+            schemas = [name for name in dict.fromkeys(list(self.pages) + list(self.misses)) if name != 'unmatched']
+            targets = Counter(self.by_target.values())
+            lines = [f"Schema {name}: {targets[name]} targets, {self.pages[name]} pages, {self.misses[name]} misses"
+                     for name in schemas]
+            if self.misses['unmatched']:
+                lines.append(f"No schema matched {self.misses['unmatched']} pages")
+            return '\n'.join(lines)
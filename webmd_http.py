@@ -0,0 +1,177 @@
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util import Retry, make_headers
+
+from webmd_archive import ResponseArchive
+from webmd_cache import CacheEntry, HTTPCache
+from webmd_instrument import get_recorder
+from webmd_ratelimit import BACKOFF_STATUS_CODES, AdaptiveRateLimiter, parse_retry_after
+
+# Headers shared by every WebMD scraper. Accept-Encoding advertises gzip/deflate,
+# plus brotli/zstd when the matching decoder is installed, so urllib3 can decode it.
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': make_headers(accept_encoding=True)['accept-encoding'],
+    'Connection': 'keep-alive',
+}
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+class WebMDClient:
+    """Pooled keep-alive HTTP client with timeouts and retry-with-backoff on 429/5xx."""
+    def __init__(self, pool_size: int = 10, timeout: float = 20.0, retries: int = 3,
+                 backoff_factor: float = 1.0, headers: Optional[Dict[str, str]] = None,
+                 cache: Optional[HTTPCache] = None, archive: Optional[ResponseArchive] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None):
+        self.timeout = timeout
+        self.cache = cache
+        self.archive = archive
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session()
+        self.session.headers.update(headers or DEFAULT_HEADERS)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            respect_retry_after_header=True,
+            raise_on_status=False,  # Hand the final response back so callers can inspect it
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """GET a URL through the cache (if any) and the shared connection pool, archiving 200 responses."""
+        kwargs.setdefault('timeout', self.timeout)
+        if self.cache is None:
+            return self._fetch(url, **kwargs)
+
+        entry = self.cache.lookup(url)
+        if entry is not None and entry.is_fresh:
+            self.cache.count('hit')
+            get_recorder().count('cache_hits')
+            return self._cached_response(entry)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry is not None and entry.can_revalidate:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        response = self._fetch(url, headers=headers, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            self.cache.count('revalidated')
+            get_recorder().count('cache_revalidated')
+            self.cache.touch(url)
+            return self._cached_response(entry)
+
+        self.cache.count('miss')
+        if response.status_code == 200:
+            self.cache.store(url, response.content, dict(response.headers), response.encoding)
+        return response
+
+    def invalidate(self, url: str):
+        """Drop a cached page that turned out to be unusable (e.g. a block page served with 200)."""
+        if self.cache is not None:
+            self.cache.invalidate(url)
+
+    def _fetch(self, url: str, **kwargs) -> requests.Response:
+        """Send a request and archive a 200 response; cache hits and revalidations are not new fetches."""
+        response = self._send(url, **kwargs)
+        if self.archive is not None and response.status_code == 200:
+            self.archive.record(url, response.content, dict(response.headers), response.encoding)
+        return response
+
+    def _send(self, url: str, **kwargs) -> requests.Response:
+        """Send a request over the network, paced by the rate limiter (if any) and reported back to it."""
+        recorder = get_recorder()
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(url)
+        try:
+            response = self.session.get(url, **kwargs)
+        except requests.RequestException:
+            recorder.count('request_errors')
+            if self.rate_limiter is not None:
+                self.rate_limiter.record_error(url)
+            raise
+
+        retries = getattr(response.raw, 'retries', None)
+        history = retries.history if retries is not None else ()
+        recorder.count('requests')
+        recorder.count('retries', len(history))
+        # tell() is what came over the wire, before gzip/brotli decoding
+        recorder.count('bytes_downloaded', response.raw.tell() if hasattr(response.raw, 'tell') else len(response.content))
+        recorder.count('bytes_decoded', len(response.content))
+        if self.rate_limiter is None:
+            return response
+
+        # urllib3 retries 429/5xx itself; the responses it retried still mean the server is struggling
+        for attempt in history:
+            if attempt.status in BACKOFF_STATUS_CODES:
+                self.rate_limiter.record(url, attempt.status, response.elapsed.total_seconds())
+        self.rate_limiter.record(url, response.status_code, response.elapsed.total_seconds(),
+                                 parse_retry_after(response.headers.get('Retry-After')))
+        return response
+
+    def _cached_response(self, entry: CacheEntry) -> requests.Response:
+        """Rebuild a requests.Response from a cache entry."""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = entry.url
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response.encoding = entry.encoding
+        response._content = entry.body
+        return response
+
+    def close(self):
+        self.session.close()
+
+class ReplayClient:
+    """Drop-in for WebMDClient that answers from a ResponseArchive and never touches the network."""
+    def __init__(self, archive: ResponseArchive):
+        self.archive = archive
+        self.cache = None
+        self.rate_limiter = None
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Return the latest archived version of a URL, or a 404 if it was never fetched."""
+        archived = self.archive.latest(url)
+        response = requests.Response()
+        response.url = url
+        if archived is None:
+            response.status_code = 404
+            response.reason = 'Not in archive'
+            response._content = b''
+            return response
+        get_recorder().count('pages_replayed')
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict(archived.headers)
+        response.encoding = archived.encoding
+        response._content = archived.body
+        return response
+
+    def invalidate(self, url: str):
+        """Archived pages are kept as they were fetched."""
+
+    def close(self):
+        self.archive.close()
+
+_default_client: Optional[WebMDClient] = None
+_default_client_lock = threading.Lock()
+
+def get_default_client() -> WebMDClient:
+    """Return the process-wide client shared by all scrapers."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = WebMDClient(cache=HTTPCache(), archive=ResponseArchive(), rate_limiter=AdaptiveRateLimiter())
+        return _default_client
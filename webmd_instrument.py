@@ -0,0 +1,112 @@
+import argparse
+import contextlib
+import cProfile
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+class RunRecorder:
+    """Thread-safe timings per stage (fetch, extract, parse, write), target and page, plus run counters."""
+    def __init__(self, name: str = 'run'):
+        self.name = name
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.start = time.perf_counter()
+        self.records: List[dict] = []
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, stage: str, target: Optional[str] = None, page: Optional[int] = None) -> Iterator[None]:
+        """Time the enclosed block as one sample of `stage`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                self.records.append({'stage': stage, 'target': target, 'page': page, 'seconds': seconds})
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] += amount
+
+    @staticmethod
+    def _summarize(samples: List[float]) -> dict:
+        ordered = sorted(samples)
+        return {
+            'count': len(ordered),
+            'total_s': sum(ordered),
+            'p50_ms': ordered[len(ordered) // 2] * 1000,
+            'p99_ms': ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)] * 1000,
+            'max_ms': ordered[-1] * 1000,
+        }
+
+    def report(self) -> dict:
+        """Structured run report: per-stage and per-target summaries, counters and every sample."""
+        with self.lock:
+            records = list(self.records)
+            counters = dict(self.counters)
+        by_stage: Dict[str, List[float]] = defaultdict(list)
+        by_target: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+        for record in records:
+            by_stage[record['stage']].append(record['seconds'])
+            if record['target'] is not None:
+                by_target[record['target']][record['stage']].append(record['seconds'])
+        return {
+            'run': self.name,
+            'started_at': self.started_at,
+            'wall_s': time.perf_counter() - self.start,
+            'counters': counters,
+            'stages': {stage: self._summarize(samples) for stage, samples in by_stage.items()},
+            'targets': {target: {stage: self._summarize(samples) for stage, samples in stages.items()}
+                        for target, stages in by_target.items()},
+            'samples': records,
+        }
+
+    def summary(self) -> str:
+        """One line per stage for the end of a run."""
+        report = self.report()
+        lines = [f"Run {self.name}: {report['wall_s']:.2f}s wall, "
+                 + ', '.join(f"{name} {value}" for name, value in sorted(report['counters'].items()))]
+        for stage, stats in report['stages'].items():
+            lines.append(f"  {stage:<8} {stats['count']:>6} x  {stats['total_s']:8.2f}s total  "
+                         f"p50 {stats['p50_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms")
+        return '\n'.join(lines)
+
+_recorder = RunRecorder()
+
+def get_recorder() -> RunRecorder:
+    """Return the recorder of the current run, shared by the scrapers and the HTTP client."""
+    return _recorder
+
+def add_instrumentation_args(parser: argparse.ArgumentParser):
+    parser.add_argument('--report', help='Write a JSON run report (stage timings, bytes, retries, empty pages) here')
+    parser.add_argument('--profile', help='Profile the main thread with cProfile and write the stats here '
+                        '(view with snakeviz or pstats; use py-spy for the fetcher threads)')
+
+@contextlib.contextmanager
+def instrumented_run(name: str, report_path: Optional[str] = None,
+                     profile_path: Optional[str] = None) -> Iterator[RunRecorder]:
+    """Start a fresh run recorder, optionally under cProfile, and write its report when the run ends."""
+    global _recorder
+    _recorder = RunRecorder(name)
+    profiler = cProfile.Profile() if profile_path else None
+    # Worker threads are named (webmd-fetch_0, ...), so py-spy dumps of a live run are readable too
+    threading.current_thread().name = name
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield _recorder
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            print(f"Saved profile to {profile_path}")
+        print(_recorder.summary())
+        if report_path:
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(_recorder.report(), f, indent=2)
+            print(f"Saved run report to {report_path}")
@@ -0,0 +1,432 @@
+r"""Persistent SQLite work queue of (target, page) review scraping jobs.
+
+Targets are added with a priority (lower runs first); only their first page is queued
+until it reports the review count, then the remaining pages are queued at the target's
+priority plus its page count, so small targets finish before large ones. Targets with
+no review count are paged one page at a time until an empty page.
+
+Worker processes lease jobs (a lease that expires, e.g. because its worker died, is
+handed out again), retry failures with exponential backoff and move jobs that fail
+max_attempts times to the dead-letter list. Reviews are upserted into the SQLite review
+store (see review_db.py). The queue survives restarts: enqueueing again only adds what
+is missing, and `work` picks up wherever the last run stopped.
+
+Usage:
+    python webmd_jobs.py enqueue --supplements webmd_supplement_urls.csv
+    python webmd_jobs.py enqueue --target Flomax --url https://reviews.webmd.com/drugs/drugreview-4154-flomax-oral \
+        --condition-id 4139 --drug --priority -10
+    python webmd_jobs.py work --workers 4 --db reviews.sqlite --watch
+    python webmd_jobs.py watch
+    python webmd_jobs.py dead
+    python webmd_jobs.py requeue-dead
+"""
+import argparse
+import contextlib
+import importlib
+import math
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+import pandas as pd
+
+from review_db import DEFAULT_DB, ReviewDB
+from webmd_http import WebMDClient
+from webmd_instrument import add_instrumentation_args, get_recorder, instrumented_run
+from webmd_ratelimit import AdaptiveRateLimiter
+
+reviews_module = importlib.import_module('webmd-scraper-all-supplements')
+ratings_module = importlib.import_module('webmd-ratings-scraper')
+ReviewTarget = reviews_module.ReviewTarget
+
+DEFAULT_QUEUE = 'webmd_jobs.sqlite'
+STATES = ('queued', 'leased', 'done', 'dead')
+POLL_SECONDS = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS targets (
+    name TEXT PRIMARY KEY,
+    base_url TEXT NOT NULL,
+    condition_id TEXT NOT NULL DEFAULT '',
+    is_supplement INTEGER NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    num_pages INTEGER,
+    num_reviews INTEGER,
+    added_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    target TEXT NOT NULL REFERENCES targets (name),
+    page INTEGER NOT NULL,
+    priority INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    reviews INTEGER,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    UNIQUE (target, page)
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (state, priority, id);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at);
+"""
+
+@dataclass
+class Job:
+    id: int
+    target: ReviewTarget
+    page: int
+    priority: int
+    attempts: int
+    max_attempts: int
+    lease_owner: str
+
+class JobQueue:
+    """Connection to the job queue; open one per process."""
+    def __init__(self, path: str = DEFAULT_QUEUE):
+        self.path = path
+        # Transactions are explicit (BEGIN IMMEDIATE), so a lease can't be handed to two workers
+        self.db = sqlite3.connect(path, timeout=30.0, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.db
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def _insert_pages(self, target: str, pages: range, priority: int, max_attempts: int) -> int:
+        now = time.time()
+        cursor = self.db.executemany("""
+            INSERT OR IGNORE INTO jobs (target, page, priority, max_attempts, available_at, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(target, page, priority, max_attempts, now, now) for page in pages])
+        return cursor.rowcount
+
+    def add_target(self, target: ReviewTarget, priority: int = 0, max_attempts: int = 5) -> int:
+        """Add or update a target and queue its first page (every page if num_pages is set); returns the jobs added."""
+        with self.transaction():
+            self.db.execute("""
+                INSERT INTO targets (name, base_url, condition_id, is_supplement, priority, num_pages, added_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    base_url = excluded.base_url, condition_id = excluded.condition_id,
+                    is_supplement = excluded.is_supplement, priority = excluded.priority,
+                    num_pages = COALESCE(excluded.num_pages, num_pages)
+            """, (target.name, target.base_url, target.condition_id, int(target.is_supplement), priority,
+                  target.num_pages, datetime.now().isoformat(timespec='seconds')))
+            if target.num_pages is None:
+                return self._insert_pages(target.name, range(1, 2), priority, max_attempts)
+            return self._insert_pages(target.name, range(1, target.num_pages + 1),
+                                      priority + target.num_pages, max_attempts)
+
+    def lease(self, owner: str, lease_seconds: float = 300.0) -> Optional[Job]:
+        """Lease the most urgent ready job to owner, or return None if no job is ready."""
+        now = time.time()
+        with self.transaction():
+            # An expired lease counts as a failed attempt; the last one goes to the dead-letter list
+            self.db.execute("""
+                UPDATE jobs SET state = 'dead', last_error = 'lease expired', lease_owner = NULL, finished_at = ?
+                WHERE state = 'leased' AND lease_expires < ? AND attempts >= max_attempts
+            """, (now, now))
+            row = self.db.execute("""
+                SELECT jobs.id, jobs.page, jobs.priority, jobs.attempts, jobs.max_attempts,
+                       targets.name, targets.base_url, targets.condition_id, targets.is_supplement, targets.num_pages
+                FROM jobs JOIN targets ON targets.name = jobs.target
+                WHERE (jobs.state = 'queued' AND jobs.available_at <= ?)
+                   OR (jobs.state = 'leased' AND jobs.lease_expires < ?)
+                ORDER BY jobs.priority, jobs.id
+                LIMIT 1
+            """, (now, now)).fetchone()
+            if row is None:
+                return None
+            job_id, page, priority, attempts, max_attempts, name, base_url, condition_id, is_supplement, num_pages = row
+            self.db.execute("""
+                UPDATE jobs SET state = 'leased', attempts = attempts + 1, lease_owner = ?, lease_expires = ?
+                WHERE id = ?
+            """, (owner, now + lease_seconds, job_id))
+        target = ReviewTarget(name, base_url, condition_id, bool(is_supplement), num_pages)
+        return Job(job_id, target, page, priority, attempts + 1, max_attempts, owner)
+
+    def complete(self, job: Job, reviews: int, num_pages: Optional[int] = None,
+                 review_count: Optional[int] = None, next_page: bool = False):
+        """Mark a leased job done, queueing the target's remaining pages once page 1 has reported how many there are."""
+        with self.transaction():
+            updated = self.db.execute("""
+                UPDATE jobs SET state = 'done', reviews = ?, lease_owner = NULL, lease_expires = NULL,
+                    last_error = NULL, finished_at = ?
+                WHERE id = ? AND state = 'leased' AND lease_owner = ?
+            """, (reviews, time.time(), job.id, job.lease_owner)).rowcount
+            if not updated:
+                print(f"Lease on {job.target.name} page {job.page} was lost; result kept, pages not queued")
+                return
+            target_priority = self.db.execute("SELECT priority FROM targets WHERE name = ?",
+                                              (job.target.name,)).fetchone()[0]
+            if num_pages is not None:
+                self.db.execute("UPDATE targets SET num_pages = ?, num_reviews = ? WHERE name = ?",
+                                (num_pages, review_count, job.target.name))
+                self._insert_pages(job.target.name, range(2, num_pages + 1),
+                                   target_priority + num_pages, job.max_attempts)
+            if next_page and job.page < reviews_module.MAX_PAGES:
+                self._insert_pages(job.target.name, range(job.page + 1, job.page + 2),
+                                   target_priority + job.page + 1, job.max_attempts)
+
+    def fail(self, job: Job, error: str, backoff: float = 30.0):
+        """Put a failed job back after an exponential backoff, or on the dead-letter list after max_attempts."""
+        now = time.time()
+        dead = job.attempts >= job.max_attempts
+        with self.transaction():
+            self.db.execute("""
+                UPDATE jobs SET state = ?, available_at = ?, lease_owner = NULL, lease_expires = NULL,
+                    last_error = ?, finished_at = ?
+                WHERE id = ? AND state = 'leased' AND lease_owner = ?
+            """, ('dead' if dead else 'queued', now + backoff * 2 ** (job.attempts - 1), error,
+                  now if dead else None, job.id, job.lease_owner))
+        if dead:
+            print(f"{job.target.name} page {job.page} failed {job.attempts} times; moved to the dead-letter list")
+
+    def has_pending(self) -> bool:
+        """Whether any job is still queued (possibly backing off) or leased."""
+        return self.db.execute("SELECT 1 FROM jobs WHERE state IN ('queued', 'leased') LIMIT 1").fetchone() is not None
+
+    def dead_jobs(self) -> pd.DataFrame:
+        return pd.read_sql_query("""
+            SELECT target, page, attempts, last_error, datetime(finished_at, 'unixepoch', 'localtime') AS failed_at
+            FROM jobs WHERE state = 'dead' ORDER BY target, page
+        """, self.db)
+
+    def requeue_dead(self) -> int:
+        """Give every dead job a fresh set of attempts."""
+        with self.transaction():
+            return self.db.execute("""
+                UPDATE jobs SET state = 'queued', attempts = 0, available_at = ?, finished_at = NULL
+                WHERE state = 'dead'
+            """, (time.time(),)).rowcount
+
+    def status(self, window: float = 60.0) -> dict:
+        """Jobs per state, targets finished and the throughput over the last `window` seconds."""
+        now = time.time()
+        states = Counter(dict.fromkeys(STATES, 0))
+        states.update(dict(self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()))
+        pages, reviews = self.db.execute("""
+            SELECT COUNT(*), COALESCE(SUM(reviews), 0) FROM jobs WHERE state = 'done' AND finished_at >= ?
+        """, (now - window,)).fetchone()
+        targets, finished = self.db.execute("""
+            SELECT COUNT(*), COALESCE(SUM(NOT EXISTS (
+                SELECT 1 FROM jobs WHERE jobs.target = targets.name AND jobs.state IN ('queued', 'leased'))), 0)
+            FROM targets
+        """).fetchone()
+        total_reviews = self.db.execute("SELECT COALESCE(SUM(reviews), 0) FROM jobs WHERE state = 'done'").fetchone()[0]
+        pages_per_min = pages * 60.0 / window
+        remaining = states['queued'] + states['leased']
+        return {
+            'states': dict(states),
+            'targets': targets,
+            'targets_finished': finished,
+            'reviews': total_reviews,
+            'pages_per_min': pages_per_min,
+            'reviews_per_s': reviews / window,
+            # Only pages already known count: page counts are discovered as first pages complete
+            'eta_s': remaining * 60.0 / pages_per_min if pages_per_min else None,
+        }
+
+    def close(self):
+        self.db.close()
+
+def format_status(status: dict) -> str:
+    states = status['states']
+    eta = f"{status['eta_s'] / 60:.1f} min" if status['eta_s'] is not None else '-'
+    return (f"[{datetime.now():%H:%M:%S}] queued {states['queued']}, leased {states['leased']}, "
+            f"done {states['done']}, dead {states['dead']} | targets {status['targets_finished']}/{status['targets']} "
+            f"| {status['reviews']} reviews | {status['pages_per_min']:.1f} pages/min, "
+            f"{status['reviews_per_s']:.1f} reviews/s | ETA {eta}")
+
+def supplement_targets(filename: str) -> List[ReviewTarget]:
+    """Review targets for the supplements in a name/url CSV such as webmd_supplement_urls.csv."""
+    targets = []
+    for row in pd.read_csv(filename).itertuples(index=False):
+        review_url = ratings_module.review_url_for(row.url) if isinstance(row.url, str) else None
+        if review_url is None:
+            print(f"Skipping {row.name}: {row.url} is not a supplement monograph URL")
+            continue
+        targets.append(ReviewTarget(name=row.name, base_url=review_url, condition_id='', is_supplement=True))
+    return targets
+
+def worker_client(workers: int) -> WebMDClient:
+    """HTTP client for one worker process.
+
+    Each process has its own rate limiter, so the default rates are split between the
+    workers. The HTTP cache and response archive are not shared between processes.
+    """
+    default = AdaptiveRateLimiter()
+    return WebMDClient(rate_limiter=AdaptiveRateLimiter(initial_rate=default.initial_rate / workers,
+                                                       min_rate=default.min_rate / workers,
+                                                       max_rate=default.max_rate / workers))
+
+def process_job(scraper, queue: JobQueue, db: ReviewDB, job: Job, backoff: float = 30.0):
+    """Fetch, parse and store one page, then mark the job done or failed."""
+    target = job.target
+    try:
+        discovering = job.page == 1 and target.num_pages is None
+        reviews, review_count = scraper.fetch_page(target, job.page, with_count=discovering)
+        parsed = scraper.parse_page(target, reviews)
+        with get_recorder().stage('write', target.name, job.page):
+            db.upsert_reviews(parsed)
+    except Exception as e:
+        get_recorder().count('page_errors')
+        print(f"Error on {target.name} page {job.page} (attempt {job.attempts}/{job.max_attempts}): {str(e)}")
+        queue.fail(job, f"{type(e).__name__}: {e}", backoff)
+        return
+
+    if discovering:
+        num_pages = None
+        if not reviews:
+            num_pages = 1
+        elif review_count is not None:
+            num_pages = max(math.ceil(review_count / len(reviews)), 1)
+            print(f"{target.name}: {review_count} reviews across {num_pages} pages")
+        else:
+            print(f"Could not find a review count for {target.name}; paging until the first empty page")
+        queue.complete(job, len(parsed), num_pages, review_count, next_page=num_pages is None)
+    else:
+        queue.complete(job, len(parsed), next_page=target.num_pages is None and bool(reviews))
+
+def run_worker(queue_path: str, db_path: str, index: int, workers: int, lease_seconds: float,
+               backoff: float = 30.0):
+    """Worker process: drain the queue until nothing is queued or leased."""
+    with instrumented_run(f'webmd-jobs-worker_{index}'):
+        queue = JobQueue(queue_path)
+        db = ReviewDB(db_path)
+        scraper = reviews_module.WebMDReviewScraper(max_workers=1, client=worker_client(workers))
+        owner = f"{socket.gethostname()}:{os.getpid()}"
+        try:
+            while True:
+                job = queue.lease(owner, lease_seconds)
+                if job is not None:
+                    process_job(scraper, queue, db, job, backoff)
+                    continue
+                # Retries backing off and other workers' leases may still add work
+                if not queue.has_pending():
+                    break
+                time.sleep(POLL_SECONDS)
+        finally:
+            queue.close()
+            db.close()
+
+def watch(queue: JobQueue, interval: float, workers: Optional[List[multiprocessing.Process]] = None):
+    """Print a status line every interval seconds until the queue is drained (or the workers exit)."""
+    while True:
+        print(format_status(queue.status()), flush=True)
+        if not queue.has_pending() or (workers is not None and not any(worker.is_alive() for worker in workers)):
+            break
+        time.sleep(interval)
+
+def work(args: argparse.Namespace):
+    queue = JobQueue(args.queue)
+    workers = [multiprocessing.Process(target=run_worker, name=f'webmd-worker_{index}',
+                                       args=(args.queue, args.db, index, args.workers, args.lease, args.backoff))
+               for index in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    try:
+        if args.watch:
+            watch(queue, args.interval, workers)
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        # Leases of interrupted jobs expire and are handed out on the next run
+        print("Interrupted; stopping workers")
+        for worker in workers:
+            worker.terminate()
+    print(format_status(queue.status()))
+    queue.close()
+
+def enqueue(args: argparse.Namespace):
+    if args.supplements:
+        targets = supplement_targets(args.supplements)
+        if args.limit:
+            targets = targets[:args.limit]
+    elif args.target and args.url:
+        targets = [ReviewTarget(name=args.target, base_url=args.url, condition_id=args.condition_id,
+                                is_supplement=not args.drug, num_pages=args.pages)]
+    else:
+        raise SystemExit("Pass --supplements CSV, or --target NAME and --url URL")
+
+    queue = JobQueue(args.queue)
+    added = sum(queue.add_target(target, args.priority, args.max_attempts) for target in targets)
+    print(f"Queued {added} new jobs for {len(targets)} targets in {args.queue}")
+    queue.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queue', default=DEFAULT_QUEUE, help='SQLite job queue')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = commands.add_parser('enqueue', help='Add targets to the queue')
+    enqueue_parser.add_argument('--supplements', help='Queue every supplement in this CSV (e.g. webmd_supplement_urls.csv)')
+    enqueue_parser.add_argument('--limit', type=int, help='Only queue the first N supplements')
+    enqueue_parser.add_argument('--target', help='Name of a single target')
+    enqueue_parser.add_argument('--url', help='Review page URL of the single target')
+    enqueue_parser.add_argument('--condition-id', default='', help='WebMD condition id of the single target')
+    enqueue_parser.add_argument('--drug', action='store_true', help='The single target is a drug, not a supplement')
+    enqueue_parser.add_argument('--pages', type=int, help='Page count of the single target, if known')
+    enqueue_parser.add_argument('--priority', type=int, default=0, help='Lower runs first (default 0)')
+    enqueue_parser.add_argument('--max-attempts', type=int, default=5,
+                                help='Attempts before a job moves to the dead-letter list')
+
+    work_parser = commands.add_parser('work', help='Drain the queue with worker processes')
+    work_parser.add_argument('--workers', type=int, default=4, help='Worker processes')
+    work_parser.add_argument('--db', default=DEFAULT_DB, help='SQLite review store the reviews are upserted into')
+    work_parser.add_argument('--lease', type=float, default=300.0, help='Seconds before an unfinished job is handed out again')
+    work_parser.add_argument('--backoff', type=float, default=30.0,
+                             help='Seconds before a failed job is retried, doubling with each attempt')
+    work_parser.add_argument('--watch', action='store_true', help='Print progress while the workers run')
+    work_parser.add_argument('--interval', type=float, default=5.0, help='Seconds between progress lines')
+    add_instrumentation_args(work_parser)
+
+    watch_parser = commands.add_parser('watch', help='Print progress and throughput until the queue is drained')
+    watch_parser.add_argument('--interval', type=float, default=5.0, help='Seconds between progress lines')
+    commands.add_parser('status', help='Print the queue status once')
+    commands.add_parser('dead', help='List the dead-letter jobs')
+    commands.add_parser('requeue-dead', help='Queue the dead-letter jobs again')
+    args = parser.parse_args()
+
+    if args.command == 'enqueue':
+        enqueue(args)
+    elif args.command == 'work':
+        with instrumented_run('webmd-jobs', args.report, args.profile):
+            work(args)
+    else:
+        queue = JobQueue(args.queue)
+        if args.command == 'watch':
+            try:
+                watch(queue, args.interval)
+            except KeyboardInterrupt:
+                pass
+        elif args.command == 'status':
+            print(format_status(queue.status()))
+        elif args.command == 'dead':
+            dead = queue.dead_jobs()
+            print(dead.to_string(index=False) if len(dead) else "No dead jobs")
+        elif args.command == 'requeue-dead':
+            print(f"Requeued {queue.requeue_dead()} dead jobs")
+        queue.close()
+
+if __name__ == "__main__":
+    main()
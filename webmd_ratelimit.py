@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+BACKOFF_STATUS_CODES = (429, 503)
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+@dataclass
+class HostBucket:
+    rate: float
+    tokens: float
+    updated: float
+    blocked_until: float = 0.0
+    last_decrease: float = 0.0
+    latency: Optional[float] = None   # Moving average of response latency
+    baseline: Optional[float] = None  # Lowest moving average seen, i.e. latency when the host is healthy
+    requests: int = 0
+    waited: float = 0.0
+    backoffs: Counter = field(default_factory=Counter)
+
+class AdaptiveRateLimiter:
+    """Per-host token bucket whose rate adapts AIMD-style to the responses it is told about.
+
+    Every healthy response adds increase / rate to the rate (about `increase` requests/second
+    per second of healthy traffic). A 429/503, or a moving-average latency above
+    latency_factor times the host's healthy baseline, multiplies the rate by `decrease`
+    (at most once per second) and honors Retry-After before the next request.
+    """
+    def __init__(self, initial_rate: float = 1.0, min_rate: float = 0.2, max_rate: float = 10.0,
+                 increase: float = 0.1, decrease: float = 0.5, burst: float = 1.0,
+                 latency_factor: float = 3.0, latency_floor: float = 0.5):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.latency_factor = latency_factor
+        self.latency_floor = latency_floor  # Latency below this never counts as unhealthy
+        self.buckets: Dict[str, HostBucket] = {}
+        self.lock = threading.Lock()
+
+    def _bucket(self, host: str, now: float) -> HostBucket:
+        if host not in self.buckets:
+            self.buckets[host] = HostBucket(rate=self.initial_rate, tokens=self.burst, updated=now)
+        return self.buckets[host]
+
+    def acquire(self, url: str):
+        """Block until the URL's host has a token for another request."""
+        with self.lock:
+            now = time.monotonic()
+            bucket = self._bucket(urlparse(url).netloc, now)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+            # Taking the token up front reserves this caller's place in line
+            bucket.tokens -= 1
+            delay = max(-bucket.tokens / bucket.rate, bucket.blocked_until - now, 0.0)
+            bucket.requests += 1
+            bucket.waited += delay
+        if delay > 0:
+            time.sleep(delay)
+
+    def record(self, url: str, status: int, latency: float, retry_after: Optional[float] = None):
+        """Adapt the host's rate to one response."""
+        with self.lock:
+            now = time.monotonic()
+            bucket = self._bucket(urlparse(url).netloc, now)
+            if status in BACKOFF_STATUS_CODES:
+                if retry_after is not None:
+                    bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+                self._decrease(bucket, f'status_{status}', now)
+                return
+
+            bucket.latency = latency if bucket.latency is None else 0.8 * bucket.latency + 0.2 * latency
+            bucket.baseline = bucket.latency if bucket.baseline is None else min(bucket.baseline, bucket.latency)
+            if bucket.latency > max(self.latency_factor * bucket.baseline, self.latency_floor):
+                self._decrease(bucket, 'latency', now)
+            else:
+                bucket.rate = min(self.max_rate, bucket.rate + self.increase / bucket.rate)
+
+    def record_error(self, url: str):
+        """Back off after a request that failed without a response (timeout, connection reset)."""
+        with self.lock:
+            now = time.monotonic()
+            self._decrease(self._bucket(urlparse(url).netloc, now), 'error', now)
+
+    def _decrease(self, bucket: HostBucket, reason: str, now: float):
+        bucket.backoffs[reason] += 1
+        # A burst of errors from one overloaded moment should only halve the rate once
+        if now - bucket.last_decrease >= 1.0:
+            bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+            bucket.last_decrease = now
+
+    def metrics(self) -> Dict[str, dict]:
+        """Current rate, backoff events and time spent waiting, per host."""
+        with self.lock:
+            return {
+                host: {
+                    'rate': bucket.rate,
+                    'requests': bucket.requests,
+                    'waited_s': bucket.waited,
+                    'latency_s': bucket.latency,
+                    'backoffs': dict(bucket.backoffs),
+                }
+                for host, bucket in self.buckets.items()
+            }
+
+    def report(self) -> str:
+        """Summarize the limiter for the end of a run."""
+        lines = []
+        for host, metrics in self.metrics().items():
+            backoffs = ', '.join(f"{count} {reason}" for reason, count in sorted(metrics['backoffs'].items()))
+            lines.append(f"Rate limit {host}: {metrics['rate']:.2f} req/s after {metrics['requests']} requests, "
+                         f"{metrics['waited_s']:.1f}s waited, backoffs: {backoffs or 'none'}")
+        return '\n'.join(lines)